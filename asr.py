@@ -0,0 +1,414 @@
+import argparse
+import glob
+import math
+import os
+import re
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import speech_recognition as sr
+from recognition import recognize_concurrently, unique
+from http_transport import GOOGLE_STT_ENDPOINT, recognize_google
+from resilience import CircuitOpenError, DeadlineExceeded
+
+
+class RecognitionBackend:
+    """Speech-to-text engine behind NoiseRobustRecognizer.recognize_with_confidence"""
+
+    name = None
+
+    def recognize(self, audio, language, variants=()):
+        """Return (transcript, confidence) for ``audio``.
+
+        Raises ``sr.UnknownValueError`` when nothing was understood and
+        ``sr.RequestError`` when the engine itself failed.
+        """
+        raise NotImplementedError
+
+
+class GoogleBackend(RecognitionBackend):
+    """Google Web Speech API, trying ``language`` and its regional variants
+
+    With a ``transport`` (http_transport.HttpTransport) requests go over its
+    pooled keep-alive connections to ``endpoint`` instead of a new urllib
+    connection each.
+    """
+
+    name = "google"
+
+    def __init__(self, recognizer, concurrent=True, deadline=6, threshold=0.3, locale_stats=None, max_workers=4,
+                 guard=None, transport=None, endpoint=GOOGLE_STT_ENDPOINT):
+        self.recognizer = recognizer
+        self.guard = guard  # resilience.Guard for the Web Speech API, or None
+        self.transport = transport
+        self.endpoint = endpoint
+        self.recognizer.operation_timeout = deadline
+        self.concurrent = concurrent
+        self.deadline = deadline
+        self.threshold = threshold
+        self.locale_stats = locale_stats
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="recognition")
+        self.last_locale = None
+
+    def recognize_google(self, audio, language, show_all=True):
+        if self.transport is None:
+            return self.recognizer.recognize_google(audio, language=language, show_all=show_all)
+        return recognize_google(self.transport, audio, language, show_all, endpoint=self.endpoint,
+                                timeout=self.deadline)
+
+    def request(self, audio, language, show_all=True):
+        """One recognize_google call, through the guard when there is one"""
+        if self.guard is None:
+            return self.recognize_google(audio, language, show_all=show_all)
+        try:
+            return self.guard.call(
+                self.recognize_google,
+                audio,
+                language=language,
+                show_all=show_all,
+                ignore=(sr.UnknownValueError,)
+            )
+        except (CircuitOpenError, DeadlineExceeded) as e:
+            raise sr.RequestError(str(e))
+
+    def record_locale(self, attempted, winner, confidence, baseline_calls):
+        """Feed the outcome of one utterance into the locale statistics"""
+        if self.locale_stats is not None:
+            self.locale_stats.record(attempted, winner, confidence, baseline_calls)
+
+    def score_locales(self, attempted, confidences, baseline_calls):
+        """Credit the locale that recognized the utterance most confidently, whichever answered first"""
+        winner = max(confidences, key=confidences.get) if confidences else None
+        self.record_locale(attempted, winner, confidences.get(winner, 0), baseline_calls)
+
+    def recognize(self, audio, language, variants=()):
+        # Try Google Speech Recognition with language variants
+        languages_to_try = [language] + list(variants)
+
+        if self.locale_stats is not None:
+            candidates = self.locale_stats.order(languages_to_try)
+        else:
+            candidates = languages_to_try
+
+        if self.concurrent:
+            candidates = unique(candidates)
+            baseline_calls = len(unique(languages_to_try))
+            transcript, confidence, self.last_locale = recognize_concurrently(
+                lambda lang: self.request(audio, lang),
+                candidates,
+                self.executor,
+                deadline=self.deadline,
+                threshold=self.threshold,
+                scored=lambda attempted, confidences: self.score_locales(attempted, confidences, baseline_calls)
+            )
+            if transcript is None:
+                raise sr.UnknownValueError()
+            print(f"Recognized with locale {self.last_locale}")
+            return transcript, confidence
+
+        attempted = []
+        for lang in candidates:
+            try:
+                # Get recognition results
+                attempted.append(lang)
+                result = self.request(audio, lang)
+
+                if result and isinstance(result, dict) and 'alternative' in result:
+                    # Get the best alternative with confidence
+                    alternatives = result['alternative']
+                    if alternatives:
+                        best_result = alternatives[0]
+                        confidence = best_result.get('confidence', 0)
+                        transcript = best_result.get('transcript', '')
+
+                        # Only return if confidence is reasonable
+                        if confidence > self.threshold or len(alternatives) == 1:
+                            self.last_locale = lang
+                            self.record_locale(attempted, lang, confidence, languages_to_try.index(lang) + 1)
+                            return transcript.lower(), confidence
+
+            except sr.UnknownValueError:
+                continue
+            except sr.RequestError:
+                continue
+
+        # Fallback to simple recognition
+        attempted.append(language)
+        self.last_locale = None
+        self.record_locale(attempted, None, 0, len(languages_to_try) + 1)
+        result = self.request(audio, language, show_all=False)
+        self.last_locale = language
+        return result.lower(), 0.8
+
+
+class FallbackBackend(RecognitionBackend):
+    """``primary`` while its service is healthy, a local engine while it is failing
+
+    The local engine is created by ``create_fallback`` on a background thread
+    as soon as the backend is, so an outage never waits for a model to load
+    on the recognition thread. A failed load is remembered rather than
+    retried for every utterance. Until the engine is ready, or when it could
+    not be loaded, the fallback raises ``sr.RequestError`` like any other
+    unavailable service. While ``guard``'s circuit is open the primary is
+    not tried at all.
+    """
+
+    name = "fallback"
+
+    def __init__(self, primary, create_fallback, guard):
+        self.primary = primary
+        self.create_fallback = create_fallback
+        self.guard = guard
+        self.fallback = None
+        self.error = None  # why the local engine could not be loaded
+        self.loaded = threading.Event()
+        self.last_locale = None
+        threading.Thread(target=self.load, name="asr-fallback-load", daemon=True).start()
+
+    def load(self):
+        """Create the local engine once; returns it, or None when it failed to load"""
+        try:
+            self.fallback = self.create_fallback()
+        except Exception as e:
+            self.error = e
+            print(f"Error loading the local recognition engine, it will not be used: {e}")
+        finally:
+            self.loaded.set()
+        return self.fallback
+
+    def local(self):
+        if not self.loaded.is_set():
+            raise sr.RequestError("local recognition engine is still loading")
+        if self.fallback is None:
+            raise sr.RequestError(f"local recognition engine unavailable: {self.error}")
+        return self.fallback
+
+    def recognize(self, audio, language, variants=()):
+        if not self.guard.breaker.open:
+            try:
+                transcript, confidence = self.primary.recognize(audio, language, variants)
+                self.last_locale = self.primary.last_locale
+                return transcript, confidence
+            except sr.RequestError as e:
+                print(f"Recognition service failed, using the local engine: {e}")
+        backend = self.local()
+        transcript, confidence = backend.recognize(audio, language, variants)
+        self.last_locale = backend.last_locale
+        return transcript, confidence
+
+
+def convert_to_int8(model):
+    """Dynamically quantize every Linear layer of a float Whisper model to int8"""
+    import torch
+
+    for module in model.modules():
+        if isinstance(module, torch.nn.Linear):
+            # whisper's Linear subclass only casts weights to the input dtype, which
+            # the quantized layer handles itself; quantize_dynamic matches exact types
+            module.__class__ = torch.nn.Linear
+    return torch.quantization.quantize_dynamic(model.cpu(), {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def load_whisper(model_size, device="cpu", quantize=False, cache_dir=None, download_root=None):
+    """Load a Whisper model, optionally int8-quantized with the converted weights cached on disk"""
+    import torch
+    import whisper
+
+    if not quantize:
+        return whisper.load_model(model_size, device=device, download_root=download_root)
+
+    cache_dir = cache_dir or os.path.join(os.path.expanduser("~"), ".cache", "whisper")
+    cache_path = os.path.join(cache_dir, f"{model_size}-int8.pt")
+    if os.path.exists(cache_path):
+        try:
+            return torch.load(cache_path, map_location="cpu", weights_only=False)
+        except Exception as e:
+            print(f"Error loading cached int8 model, converting again: {e}")
+
+    model = convert_to_int8(whisper.load_model(model_size, device="cpu", download_root=download_root))
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        temp_path = f"{cache_path}.tmp"
+        torch.save(model, temp_path)
+        os.replace(temp_path, cache_path)
+    except Exception as e:
+        print(f"Error caching int8 model: {e}")
+    return model
+
+
+class WhisperBackend(RecognitionBackend):
+    """Local openai-whisper model, loaded once and kept warm on the CPU
+
+    Audio is handed over as a float array straight from ``AudioData``; no temp
+    files. Confidence is derived from the decoder's average log-probability and
+    its no-speech probability so the wake word and command thresholds keep
+    their meaning. With ``quantize`` the Linear layers run in int8, which is
+    CPU-only; the converted model is cached under ``cache_dir``.
+    """
+
+    name = "whisper"
+
+    def __init__(self, model_size="base", threads=4, device="cpu", quantize=False, cache_dir=None,
+                 download_root=None):
+        import torch
+
+        if threads:
+            torch.set_num_threads(threads)
+        self.model_size = model_size
+        self.device = "cpu" if quantize else device
+        self.quantize = quantize
+        precision = "int8" if quantize else "float"
+        print(f"Loading Whisper '{model_size}' {precision} model on {self.device}...")
+        self.model = load_whisper(model_size, self.device, quantize, cache_dir, download_root)
+        self.lock = threading.Lock()  # one decode at a time per model instance
+        self.last_locale = None
+        self.warm_up()
+
+    def warm_up(self):
+        """Run one silent decode so the first real utterance does not pay for lazy initialisation"""
+        self.transcribe(np.zeros(16000, dtype=np.float32), language="en")
+
+    def transcribe(self, samples, language):
+        with self.lock:
+            return self.model.transcribe(
+                samples,
+                language=language,
+                fp16=self.device != "cpu",
+                temperature=0,
+                condition_on_previous_text=False
+            )
+
+    def recognize(self, audio, language, variants=()):
+        samples = np.frombuffer(audio.get_raw_data(convert_rate=16000, convert_width=2), dtype=np.int16)
+        samples = samples.astype(np.float32) / 32768.0
+
+        try:
+            result = self.transcribe(samples, language=language.split('-')[0])
+        except Exception as e:
+            raise sr.RequestError(f"whisper inference failed: {e}")
+
+        transcript = result.get("text", "").strip()
+        segments = result.get("segments") or []
+        if not transcript or not segments:
+            raise sr.UnknownValueError()
+
+        logprob = np.mean([segment["avg_logprob"] for segment in segments])
+        no_speech = np.mean([segment["no_speech_prob"] for segment in segments])
+        confidence = float(math.exp(logprob) * (1 - no_speech))
+
+        self.last_locale = result.get("language", language)
+        return transcript.lower(), confidence
+
+
+# Sentences rendered with espeak into the sample directory when it has no clips of its own
+BENCHMARK_SENTENCES = [
+    ("en", "hey eva tell me about solutech"),
+    ("en", "what can you do for customer support"),
+    ("en", "schedule a call back for the client tomorrow morning"),
+    ("en", "how many orders did we process last week"),
+    ("sw", "hujambo eva niambie kuhusu solutech"),
+    ("sw", "habari za asubuhi naweza kupata msaada"),
+]
+
+
+def normalize_words(text):
+    return re.sub(r"[^\w\s']", " ", text.lower()).split()
+
+
+def word_error_rate(reference, hypothesis):
+    """Word-level Levenshtein distance divided by the reference length"""
+    reference, hypothesis = normalize_words(reference), normalize_words(hypothesis)
+    if not reference:
+        return float(len(hypothesis) > 0)
+
+    distances = np.arange(len(hypothesis) + 1)
+    for i, word in enumerate(reference, 1):
+        previous, distances = distances, np.empty_like(distances)
+        distances[0] = i
+        substitutions = previous[:-1] + (np.array(hypothesis) != word)
+        for j in range(1, len(hypothesis) + 1):
+            distances[j] = min(previous[j] + 1, distances[j - 1] + 1, substitutions[j - 1])
+    return distances[-1] / float(len(reference))
+
+
+def benchmark_clips(directory):
+    """(wav path, language, reference) for every clip, rendering the built-in sentences if missing"""
+    os.makedirs(directory, exist_ok=True)
+    for i, (language, sentence) in enumerate(BENCHMARK_SENTENCES):
+        base = os.path.join(directory, f"sample_{i:02d}_{language}")
+        if not os.path.exists(f"{base}.wav"):
+            subprocess.run(["espeak", "-v", language, "-w", f"{base}.wav", sentence], check=True)
+            with open(f"{base}.txt", "w") as f:
+                f.write(sentence)
+
+    clips = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.wav"))):
+        base = os.path.splitext(path)[0]
+        if not os.path.exists(f"{base}.txt"):
+            continue
+        with open(f"{base}.txt") as f:
+            reference = f.read().strip()
+        language = "sw" if base.endswith("_sw") else "en"
+        clips.append((path, language, reference))
+    return clips
+
+
+def benchmark(model_size, directory, threads):
+    """Compare float and int8 Whisper on real-time factor and word error rate"""
+    from wakeword import read_wav
+
+    clips = [(path, language, reference, read_wav(path).astype(np.float32) / 32768.0)
+             for path, language, reference in benchmark_clips(directory)]
+    if not clips:
+        print(f"No benchmark clips found in {directory}")
+        return
+
+    transcripts = {}
+    timings = {}
+    for quantize in (False, True):
+        started = time.perf_counter()
+        backend = WhisperBackend(model_size=model_size, threads=threads, quantize=quantize)
+        load_time = time.perf_counter() - started
+        name = "int8" if quantize else "float"
+        transcripts[name], timings[name] = [], []
+        for path, language, reference, samples in clips:
+            started = time.perf_counter()
+            result = backend.transcribe(samples, language=language)
+            timings[name].append(time.perf_counter() - started)
+            transcripts[name].append(result.get("text", "").strip())
+        print(f"{name}: loaded in {load_time:.1f}s")
+        del backend
+
+    print(f"\n{'clip':<24}{'audio s':>8}{'RTF f32':>9}{'RTF int8':>9}{'WER f32':>9}{'WER int8':>9}{'int8/f32':>9}")
+    total_audio = 0
+    for i, (path, language, reference, samples) in enumerate(clips):
+        duration = len(samples) / 16000.0
+        total_audio += duration
+        print(
+            f"{os.path.basename(path):<24}{duration:>8.1f}"
+            f"{timings['float'][i] / duration:>9.2f}{timings['int8'][i] / duration:>9.2f}"
+            f"{word_error_rate(reference, transcripts['float'][i]):>9.2f}"
+            f"{word_error_rate(reference, transcripts['int8'][i]):>9.2f}"
+            f"{word_error_rate(transcripts['float'][i], transcripts['int8'][i]):>9.2f}"
+        )
+
+    float_rtf = sum(timings["float"]) / total_audio
+    int8_rtf = sum(timings["int8"]) / total_audio
+    drift = np.mean([word_error_rate(f, q) for f, q in zip(transcripts["float"], transcripts["int8"])])
+    print(f"\nReal-time factor: float {float_rtf:.2f}, int8 {int8_rtf:.2f} ({float_rtf / int8_rtf:.1f}x faster)")
+    print(f"Word error rate of int8 against the float model: {drift:.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark float against int8 Whisper on the sample clips")
+    parser.add_argument("--model", default="base", help="Whisper model size")
+    parser.add_argument("--samples", default=os.path.join("samples", "asr"), help="directory of WAV clips with .txt references")
+    parser.add_argument("--threads", type=int, default=4, help="CPU threads for inference")
+    args = parser.parse_args()
+    benchmark(args.model, args.samples, args.threads)
+
+
+if __name__ == "__main__":
+    main()
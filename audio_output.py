@@ -0,0 +1,292 @@
+import collections
+import threading
+import numpy as np
+import pyaudio
+
+
+class Playback:
+    """Handle to one sound queued on an AudioOutput"""
+
+    def __init__(self, output=None):
+        self.output = output
+        self.finished = threading.Event()
+        self.interrupted = False  # True when stop() dropped it before it finished
+        self.callbacks = []
+        self.lock = threading.Lock()
+
+    def done(self):
+        return self.finished.is_set()
+
+    def wait(self, timeout=None):
+        return self.finished.wait(timeout)
+
+    def stop(self):
+        """Stop this sound and everything queued with it"""
+        if self.output is not None and not self.done():
+            self.output.stop()
+
+    def add_done_callback(self, callback):
+        """Call ``callback(playback)`` once the sound has played or was stopped"""
+        with self.lock:
+            if not self.finished.is_set():
+                self.callbacks.append(callback)
+                return
+        callback(self)
+
+    def finish(self, interrupted=False):
+        with self.lock:
+            if self.finished.is_set():
+                return
+            self.interrupted = interrupted
+            self.finished.set()
+            callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception as e:
+                print(f"Error in playback callback: {e}")
+
+
+class StreamResampler:
+    """Linear-interpolation resampler for int16 mono PCM that arrives in pieces
+
+    Keeps the last input sample and the fractional read position between
+    calls, so resampling chunk by chunk gives the same signal as resampling
+    the whole sound at once.
+    """
+
+    def __init__(self, from_rate, to_rate):
+        self.step = from_rate / float(to_rate)
+        self.position = 0.0  # next output sample, in input samples from the start of ``previous``
+        self.previous = np.zeros(0, dtype=np.float64)
+
+    def process(self, pcm):
+        samples = np.concatenate([self.previous, np.frombuffer(pcm, dtype=np.int16).astype(np.float64)])
+        if len(samples) < 2:
+            self.previous = samples
+            return b""
+        positions = np.arange(self.position, len(samples) - 1, self.step)
+        resampled = np.interp(positions, np.arange(len(samples)), samples)
+        self.position = (positions[-1] + self.step if len(positions) else self.position) - (len(samples) - 1)
+        self.previous = samples[-1:]
+        return np.round(resampled).astype(np.int16).tobytes()
+
+
+class AudioOutput:
+    """Single PyAudio output stream kept open for the process lifetime
+
+    Sounds are converted to the stream format, cut into ``chunk_duration``
+    pieces and queued; a writer thread feeds them to the device back to back,
+    so consecutive sounds play without reopening the device or leaving gaps.
+    A new sound starts once ``prebuffer_duration`` of it is queued, or all of
+    it if it is shorter, and ``stop()`` drops everything queued at once.
+    With reference listeners (an echo canceller), silence is written while
+    idle so the played signal stays on the device clock.
+    """
+
+    def __init__(self, sample_rate=24000, channels=1, chunk_duration=0.02, prebuffer_duration=0.1,
+                 device_index=None):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.sample_width = pyaudio.get_sample_size(pyaudio.paInt16)
+        self.frame_width = self.sample_width * channels
+        self.chunk_frames = max(1, int(sample_rate * chunk_duration))
+        self.chunk_bytes = self.chunk_frames * self.frame_width
+        self.prebuffer_bytes = int(sample_rate * prebuffer_duration) * self.frame_width
+        self.device_index = device_index
+        self.reference_listeners = []  # callables fed every chunk written to the device, silence included
+        self.silence = b"\0" * self.chunk_bytes
+        self.chunks = collections.deque()  # (pcm, Playback finished by this chunk or None)
+        self.queued_bytes = 0
+        self.flushed = True  # False while a producer is still writing the current sound
+        self.generation = 0  # bumped by stop(), so streams still producing know to give up
+        self.playing = False
+        self.condition = threading.Condition()
+        self.audio = None
+        self.stream = None
+        self.thread = None
+        self.running = False
+
+    def start(self):
+        """Open the output device once and start the writer thread"""
+        if self.running:
+            return self
+
+        self.audio = pyaudio.PyAudio()
+        self.stream = self.audio.open(
+            format=pyaudio.paInt16,
+            channels=self.channels,
+            rate=self.sample_rate,
+            output=True,
+            output_device_index=self.device_index,
+            frames_per_buffer=self.chunk_frames
+        )
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="audio-output", daemon=True)
+        self.thread.start()
+        return self
+
+    def close(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout=1)
+        if self.stream is not None:
+            self.stream.stop_stream()
+            self.stream.close()
+            self.stream = None
+        if self.audio is not None:
+            self.audio.terminate()
+            self.audio = None
+
+    def add_reference_listener(self, listener):
+        """Feed ``listener`` every chunk written to the device from now on"""
+        with self.condition:
+            self.reference_listeners.append(listener)
+            self.condition.notify_all()  # an idle writer starts writing silence
+
+    def convert(self, sound):
+        """Raw PCM of an AudioSegment in the stream's rate, channels and width"""
+        sound = sound.set_frame_rate(self.sample_rate).set_channels(self.channels).set_sample_width(self.sample_width)
+        return sound.raw_data
+
+    def write(self, pcm, playback=None):
+        """Queue raw PCM in the stream format; call ``flush()`` once the sound is complete
+
+        ``playback`` is finished when the last chunk of ``pcm`` has been played.
+        """
+        with self.condition:
+            for start in range(0, len(pcm), self.chunk_bytes):
+                chunk = pcm[start:start + self.chunk_bytes]
+                last = start + self.chunk_bytes >= len(pcm)
+                self.chunks.append((chunk, playback if last else None))
+                self.queued_bytes += len(chunk)
+            if not pcm and playback is not None:
+                self.chunks.append((b"", playback))
+            self.flushed = False
+            self.condition.notify_all()
+
+    def flush(self):
+        """Let the end of the current sound play without waiting for the pre-buffer"""
+        with self.condition:
+            self.flushed = True
+            self.condition.notify_all()
+
+    def play(self, sound, block=True):
+        """Queue an AudioSegment after whatever is already playing and return its Playback"""
+        playback = Playback(self)
+        self.write(self.convert(sound), playback)
+        self.flush()
+        if block:
+            playback.wait()
+        return playback
+
+    def play_stream(self, chunks, sample_rate, block=True):
+        """Queue mono int16 PCM chunks at ``sample_rate`` as they are produced and return the Playback
+
+        Playback starts once the pre-buffer fills while later chunks are still
+        being produced, on a producer thread when ``block`` is False. A
+        ``stop()`` abandons the rest of the stream.
+        """
+        playback = Playback(self)
+        generation = self.generation
+        resampler = StreamResampler(sample_rate, self.sample_rate) if sample_rate != self.sample_rate else None
+
+        def produce():
+            try:
+                for pcm in chunks:
+                    if resampler is not None:
+                        pcm = resampler.process(pcm)
+                    if self.channels > 1:
+                        pcm = np.repeat(np.frombuffer(pcm, dtype=np.int16), self.channels).tobytes()
+                    with self.condition:
+                        if self.generation != generation:
+                            break
+                        self.write(pcm)
+            except Exception as e:
+                print(f"Error streaming audio: {e}")
+            finally:
+                if hasattr(chunks, "close"):
+                    chunks.close()
+                with self.condition:
+                    stopped = self.generation != generation
+                    if not stopped:
+                        self.write(b"", playback)
+                        self.flush()
+                if stopped:
+                    playback.finish(interrupted=True)
+
+        if block:
+            produce()
+            playback.wait()
+        else:
+            threading.Thread(target=produce, name="audio-stream", daemon=True).start()
+        return playback
+
+    def wait(self, timeout=None):
+        """Block until everything queued has been handed to the device"""
+        with self.condition:
+            return self.condition.wait_for(
+                lambda: not self.running or (not self.chunks and not self.playing), timeout
+            )
+
+    def stop(self):
+        """Drop all queued audio; playback ends within one chunk"""
+        with self.condition:
+            dropped = [playback for _, playback in self.chunks if playback is not None]
+            self.chunks.clear()
+            self.queued_bytes = 0
+            self.flushed = True
+            self.generation += 1
+            self.condition.notify_all()
+        for playback in dropped:
+            playback.finish(interrupted=True)
+
+    @property
+    def busy(self):
+        """True while audio is queued for playback"""
+        return bool(self.chunks)
+
+    def _ready(self):
+        return self.queued_bytes >= self.prebuffer_bytes or bool(self.chunks and self.flushed)
+
+    def _run(self):
+        try:
+            while True:
+                with self.condition:
+                    if not self.playing:
+                        self.condition.wait_for(
+                            lambda: not self.running or self._ready() or self.reference_listeners
+                        )
+                        if not self.running:
+                            break
+                        self.playing = self._ready()
+                    if self.playing and not self.chunks:
+                        # Drained or underrun: pre-buffer again before the next sound
+                        self.playing = False
+                        self.condition.notify_all()
+                        continue
+                    if self.playing:
+                        chunk, playback = self.chunks.popleft()
+                        self.queued_bytes -= len(chunk)
+                    else:
+                        chunk, playback = self.silence, None
+                if chunk:
+                    self.stream.write(chunk)
+                    for listener in self.reference_listeners:
+                        listener(chunk)
+                if playback is not None:
+                    playback.finish()
+        except Exception as e:
+            print(f"Error in audio output: {e}")
+        finally:
+            with self.condition:
+                self.running = False
+                self.playing = False
+                dropped = [playback for _, playback in self.chunks if playback is not None]
+                self.chunks.clear()
+                self.queued_bytes = 0
+                self.condition.notify_all()
+            for playback in dropped:
+                playback.finish(interrupted=True)
@@ -0,0 +1,173 @@
+import collections
+import threading
+import pyaudio
+import speech_recognition as sr
+
+
+class AudioRingBuffer:
+    """Fixed-size buffer of audio chunks addressed by absolute chunk index"""
+
+    def __init__(self, max_chunks):
+        self.chunks = collections.deque(maxlen=max_chunks)
+        self.end_index = 0  # index one past the newest chunk
+        self.closed = False
+        self.condition = threading.Condition()
+
+    @property
+    def start_index(self):
+        return self.end_index - len(self.chunks)
+
+    def append(self, chunk):
+        with self.condition:
+            self.chunks.append(chunk)
+            self.end_index += 1
+            self.condition.notify_all()
+
+    def read(self, index, timeout=None):
+        """Return (chunk, next_index), waiting for the chunk if it is not captured yet.
+
+        Readers that fell behind the buffer skip ahead to the oldest chunk still held.
+        An empty chunk means the buffer was closed or nothing arrived within timeout.
+        """
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.closed or index < self.end_index, timeout):
+                return b"", index
+            if index >= self.end_index:
+                return b"", index
+
+            index = max(index, self.start_index)
+            return self.chunks[index - self.start_index], index + 1
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+class MicrophoneStream:
+    """Single PyAudio input stream kept open by a background thread for the process lifetime"""
+
+    def __init__(self, sample_rate=16000, chunk_size=1024, buffer_duration=30, device_index=None):
+        self.sample_rate = sample_rate
+        self.chunk_size = chunk_size
+        self.sample_width = pyaudio.get_sample_size(pyaudio.paInt16)
+        self.device_index = device_index
+        self.seconds_per_chunk = float(chunk_size) / sample_rate
+        self.buffer = AudioRingBuffer(int(buffer_duration / self.seconds_per_chunk))
+        self.read_index = 0  # first chunk not yet consumed by a listener
+        self.chunk_processors = []  # callables transforming each captured chunk before it is buffered
+        self.chunk_listeners = []  # callables fed every captured chunk on the capture thread
+        self.unmuted = threading.Event()  # cleared while the assistant's own voice is playing
+        self.unmuted.set()
+        self.generation = 0  # bumped to end every source opened before
+        self.audio = None
+        self.stream = None
+        self.thread = None
+        self.running = False
+
+    def start(self):
+        """Open the input device once and start filling the ring buffer"""
+        if self.running:
+            return
+
+        self.audio = pyaudio.PyAudio()
+        self.stream = self.audio.open(
+            format=pyaudio.paInt16,
+            channels=1,
+            rate=self.sample_rate,
+            input=True,
+            input_device_index=self.device_index,
+            frames_per_buffer=self.chunk_size
+        )
+        self.running = True
+        self.thread = threading.Thread(target=self._capture, name="microphone-capture", daemon=True)
+        self.thread.start()
+
+    def _capture(self):
+        try:
+            while self.running:
+                chunk = self.stream.read(self.chunk_size, exception_on_overflow=False)
+                for processor in self.chunk_processors:
+                    chunk = processor(chunk)
+                self.buffer.append(chunk)
+                for listener in self.chunk_listeners:
+                    listener(chunk)
+        except Exception as e:
+            print(f"Error in microphone capture: {e}")
+        finally:
+            self.running = False
+            self.buffer.close()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=1)
+        if self.stream is not None:
+            self.stream.stop_stream()
+            self.stream.close()
+            self.stream = None
+        if self.audio is not None:
+            self.audio.terminate()
+            self.audio = None
+        self.buffer.close()
+
+    def mute(self):
+        """Hold listeners back while the assistant is speaking"""
+        self.unmuted.clear()
+
+    def unmute(self, start_index=None):
+        """Release listeners past everything captured while muted, or from ``start_index``"""
+        if start_index is not None:
+            self.read_index = max(self.read_index, start_index)
+        elif not self.unmuted.is_set():
+            self.read_index = self.buffer.end_index
+        self.unmuted.set()
+
+    def interrupt(self):
+        """Make every open source report end of stream"""
+        self.generation += 1
+
+    def source(self, pre_roll=0.5):
+        """Return an audio source that starts up to ``pre_roll`` seconds in the past.
+
+        Audio already handed to a previous listener is never replayed.
+        """
+        pre_roll_chunks = int(pre_roll / self.seconds_per_chunk)
+        start_index = max(self.read_index, self.buffer.end_index - pre_roll_chunks)
+        return BufferedAudioSource(self, start_index)
+
+
+class BufferedAudioSource(sr.AudioSource):
+    """``sr.AudioSource`` reading from a MicrophoneStream ring buffer instead of the device"""
+
+    READ_TIMEOUT = 2  # seconds to wait for the capture thread before reporting end of stream
+
+    def __init__(self, microphone_stream, start_index):
+        self.microphone_stream = microphone_stream
+        self.index = start_index
+        self.generation = microphone_stream.generation
+        self.SAMPLE_RATE = microphone_stream.sample_rate
+        self.SAMPLE_WIDTH = microphone_stream.sample_width
+        self.CHUNK = microphone_stream.chunk_size
+        self.stream = None
+
+    def __enter__(self):
+        self.stream = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.microphone_stream.read_index = max(self.microphone_stream.read_index, self.index)
+        self.stream = None
+
+    def read(self, size=None):
+        microphone_stream = self.microphone_stream
+        while not microphone_stream.unmuted.wait(timeout=0.1):
+            if not microphone_stream.running or self.generation != microphone_stream.generation:
+                return b""
+        if self.generation != microphone_stream.generation:
+            return b""
+
+        # Skip whatever was captured while muted
+        self.index = max(self.index, microphone_stream.read_index)
+        chunk, self.index = microphone_stream.buffer.read(self.index, timeout=self.READ_TIMEOUT)
+        return chunk
@@ -0,0 +1,69 @@
+import numpy as np
+
+
+class BargeInMonitor:
+    """Stops the assistant's speech as soon as the user talks over it
+
+    Runs as a MicrophoneStream chunk listener. While the AudioOutput has audio
+    queued, every captured chunk goes through its own VoiceActivityDetector.
+    ``min_speech_duration`` of continuous speech at least ``threshold_ratio``
+    times the detector's energy threshold stops playback. It also releases
+    listeners from where the user started talking, minus ``pre_roll``. The
+    ratio matters because the assistant's own voice reaching the microphone is
+    speech too, only quieter. With an ``echo_canceller``, the bar is instead
+    raised to ``threshold_ratio`` times the echo it expects to leave in each
+    chunk whenever that is louder. Until it has measured the echo path,
+    nothing counts as barging in. Worst-case latency is
+    ``min_speech_duration`` plus one capture chunk and one output chunk.
+    """
+
+    def __init__(self, detector, microphone_stream, output, min_speech_duration=0.3, threshold_ratio=2.0,
+                 pre_roll=0.3, echo_canceller=None):
+        self.detector = detector
+        self.stream = microphone_stream
+        self.output = output
+        self.echo_canceller = echo_canceller
+        self.min_speech_frames = max(1, int(round(min_speech_duration / detector.frame_duration)))
+        self.threshold_ratio = threshold_ratio
+        self.pre_roll = pre_roll
+        self.speech_frames = 0
+        self.interruptions = 0
+
+    def process(self, chunk):
+        if not self.output.busy:
+            if self.speech_frames:
+                self.speech_frames = 0
+                self.detector.reset()
+            return
+
+        speech, energy, _ = self.detector.process(chunk)
+        if len(speech) == 0:
+            return
+
+        level = self.detector.energy_threshold
+        if self.echo_canceller is not None:
+            residual = self.echo_canceller.expected_residual()
+            if residual is None:
+                return  # the echo path is not measured yet, so any speech could be the assistant's
+            level = max(level, residual)
+        talking = speech & (energy > level * self.threshold_ratio)
+        quiet = np.flatnonzero(~talking)
+        if len(quiet):
+            self.speech_frames = len(talking) - quiet[-1] - 1
+        else:
+            self.speech_frames += len(talking)
+
+        if self.speech_frames >= self.min_speech_frames:
+            self.interrupt()
+
+    def interrupt(self):
+        spoken = self.speech_frames * self.detector.frame_duration + self.pre_roll
+        start_index = self.stream.buffer.end_index - int(np.ceil(spoken / self.stream.seconds_per_chunk))
+        self.speech_frames = 0
+        self.detector.reset()
+        self.interruptions += 1
+        print("Barge-in detected, stopping playback")
+
+        # Release listeners first so callbacks of the stopped playback do not skip the user's words
+        self.stream.unmute(start_index)
+        self.output.stop()
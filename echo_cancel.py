@@ -0,0 +1,472 @@
+import argparse
+import collections
+import threading
+import time
+import numpy as np
+
+
+class EchoCanceller:
+    """Adaptive acoustic echo canceller for the microphone path
+
+    Partitioned-block frequency-domain NLMS (overlap-save): the echo path is
+    modelled by ``tail_duration`` seconds of filter split into blocks of
+    ``block_size`` samples, all updated together with batched FFTs. The
+    reference is whatever AudioOutput hands to the device, fed through
+    ``add_reference``.
+
+    The output and input devices run on separate clocks, so the reference is
+    not consumed sample for sample. It waits in a queue, first read
+    ``prefill_duration`` behind the newest sample as a jitter margin. How
+    many reference samples have arrived per microphone sample, fitted over
+    the last ``drift_window`` seconds, gives the clocks' rate ratio. The
+    queue is read at that rate with sinc interpolation, so the echo path the
+    filter sees stays still. Every ``delay_interval`` seconds of playback,
+    GCC-PHAT measures the bulk delay between reference and microphone. When
+    two measurements in a row agree that it has moved, the queue is
+    re-aligned to keep the echo just behind the reference. The filter taps
+    are shifted with it, so the room model survives.
+
+    Adaptation is frozen while the user talks over the assistant. Double
+    talk is detected from the coherence of the reference and the microphone:
+    the share of microphone power the reference explains linearly. This
+    share does not depend on the echo path, so a moved speaker or a volume
+    change does not look like speech. Speech the detector misses, such as
+    at the onset of playback, cannot wreck the filter either: an error more
+    than ``error_clip`` times the recent residual power is scaled down
+    before it is used to adapt (robust NLMS). ``erle`` reports how much echo
+    is being removed, averaged over the blocks with a reference and no
+    double talk.
+    ``expected_residual`` estimates how loud the echo left in the latest
+    chunk is. It is the chunk's reference power times the
+    reference-to-residual gain, measured on echo-only blocks, so a listener
+    can tell the user from what the canceller missed.
+    """
+
+    def __init__(self, sample_rate=16000, reference_rate=None, block_size=256, tail_duration=0.256,
+                 step_size=0.5, max_reference_duration=1.0, converged_erle=10.0, prefill_duration=0.04,
+                 drift_window=60.0, max_delay_duration=0.5, delay_margin=32, delay_interval=1.0,
+                 double_talk_threshold=0.4, error_clip=16.0):
+        self.sample_rate = sample_rate
+        self.reference_rate = reference_rate or sample_rate
+        self.block_size = block_size
+        self.partitions = max(1, int(np.ceil(tail_duration * sample_rate / block_size)))
+        self.step_size = step_size
+        self.max_reference = int(max_reference_duration * sample_rate)
+        self.converged_erle = converged_erle  # dB of echo removed before the echo counts as handled
+        self.double_talk_threshold = double_talk_threshold  # share of mic power the reference must explain
+        self.error_clip = error_clip
+        bins = block_size + 1
+
+        self.weights = np.zeros((self.partitions, bins), dtype=np.complex128)
+        self.history = np.zeros((self.partitions, bins), dtype=np.complex128)  # newest reference block first
+        self.power = np.full(bins, 1e-2)
+        self.previous_reference = np.zeros(block_size)
+        self.lock = threading.Lock()
+
+        # Reference queue on the output clock: samples [offset, offset + len(buffer)), read from ``position``
+        self.buffer = np.zeros(0, dtype=np.float32)
+        self.offset = 0
+        self.position = None  # next sample to read, fractional; None until the reference is flowing
+        self.prefill = int(prefill_duration * sample_rate)
+        self.max_delay = int(max_delay_duration * sample_rate)
+        self.rate = 1.0  # reference samples read per microphone sample
+        self.received = 0  # reference samples since the queue was started
+        self.consumed = 0  # microphone samples since the queue was started
+        self.clock = collections.deque(maxlen=max(2, int(drift_window * sample_rate / 1024)))  # (consumed, received)
+
+        # Bulk delay tracking
+        self.delay_margin = delay_margin  # samples the reference is kept ahead of its echo
+        self.delay_window = int(delay_interval * sample_rate)
+        self.recent_microphone = np.zeros(0)
+        self.recent_reference = np.zeros(0)
+        self.delay = None  # last bulk delay estimate, in samples
+        self.moved = None  # delay estimate waiting for confirmation before re-aligning
+
+        # Double-talk detector frames and smoothed spectra
+        self.lead = 4 * block_size  # the reference frame reaches this much further back, for the echo's delay
+        self.microphone_frame = np.zeros(8 * block_size)
+        self.reference_frame = np.zeros(8 * block_size + self.lead)
+        self.reference_spectrum = 0.0
+        self.microphone_spectrum = 0.0
+        self.cross_spectrum = 0.0
+
+        self.error_scale = None  # smoothed error power of adapting blocks, for robust NLMS
+        self.path_reference_power = 0.0  # smoothed reference power of echo-only blocks
+        self.chunk_reference_power = [0.0, 0.0]  # reference power of the previous and latest chunk
+        self.echo_power = 0.0  # smoothed microphone power of echo-only blocks
+        self.residual_power = 0.0  # smoothed power left after cancellation in the same blocks
+        self.blocks = 0
+        self.active_blocks = 0
+        self.double_talk_blocks = 0
+        self.underruns = 0
+        self.realignments = 0
+        self.processing_time = 0.0
+
+    def add_reference(self, pcm):
+        """Queue int16 PCM that was just handed to the output device"""
+        samples = np.frombuffer(pcm, dtype=np.int16).astype(np.float32)
+        if self.reference_rate != self.sample_rate and len(samples):
+            count = int(round(len(samples) * self.sample_rate / float(self.reference_rate)))
+            positions = np.arange(count) * (self.reference_rate / float(self.sample_rate))
+            samples = np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+        with self.lock:
+            self.buffer = np.concatenate([self.buffer, samples])
+            self.received += len(samples)
+            if self.position is None and len(self.buffer) > self.max_reference:
+                self.offset += len(self.buffer) - self.max_reference
+                self.buffer = self.buffer[-self.max_reference:]
+
+    def read(self, positions):
+        """Reference at fractional ``positions``, zero where it never arrived or was already dropped
+
+        Interpolates with an 8-tap Lanczos kernel: linear interpolation
+        low-passes by an amount that changes with the fractional position,
+        which the filter cannot follow while the position drifts.
+        """
+        if not len(self.buffer):
+            return np.zeros(len(positions))
+        index = positions - self.offset
+        base = np.floor(index).astype(np.int64)
+        taps = np.arange(-3, 5)
+        distance = (index - base)[:, None] - taps
+        samples = base[:, None] + taps
+        values = self.buffer[np.clip(samples, 0, len(self.buffer) - 1)]
+        values[(samples < 0) | (samples >= len(self.buffer))] = 0.0
+        return np.sum(values * np.sinc(distance) * np.sinc(distance / 4), axis=1)
+
+    def take_reference(self, count):
+        """The reference for the next ``count`` microphone samples"""
+        with self.lock:
+            end = self.offset + len(self.buffer)
+            if self.position is None:
+                if not self.received:
+                    return np.zeros(count)
+                # Start reading with the prefill still queued; clocks and delay are measured afresh
+                self.position = float(end - count - self.prefill)
+                self.received = self.consumed = 0
+                self.rate = 1.0
+                self.clock.clear()
+                self.delay = self.moved = None
+            taken = self.read(self.position + np.arange(count) * self.rate)
+            self.position += count * self.rate
+            self.consumed += count
+            level = end - self.position
+
+            if level < -count or level > self.max_reference:
+                # Playback stopped or the microphone stalled: start over when the reference flows again
+                self.position = None
+                self.received = 0
+            else:
+                if level < 0:
+                    self.underruns += 1  # late reference; reading on keeps alignment with the output clock
+                self.track_clock()
+                self.trim()
+        return taken
+
+    def track_clock(self):
+        """Fit reference samples received against microphone samples consumed; the slope is the read rate"""
+        self.clock.append((self.consumed, self.received))
+        consumed, received = np.array(self.clock, dtype=np.float64).T
+        span = consumed[-1] - consumed[0]
+        if span >= 2 * self.sample_rate:
+            slope = np.polyfit(consumed - consumed[0], received - received[0], 1)[0]
+            self.rate = float(np.clip(slope, 0.99, 1.01))
+
+    def trim(self):
+        keep = int(self.position) - self.max_delay - (self.partitions + 1) * self.block_size
+        if keep > self.offset:
+            self.buffer = self.buffer[keep - self.offset:]
+            self.offset = keep
+
+    def estimate_delay(self):
+        """Samples the echo trails the reference by (GCC-PHAT), or None when the estimate is unreliable"""
+        microphone, reference = self.recent_microphone, self.recent_reference
+        recent = reference[-(self.delay_window // self.block_size) * self.block_size:]
+        blocks = recent.reshape(-1, self.block_size)
+        if np.mean(np.mean(blocks ** 2, axis=1) > 1e4) < 0.5:
+            return None  # too little playback to correlate
+        size = 2 * len(microphone)
+        cross = np.fft.rfft(microphone, size) * np.conj(np.fft.rfft(reference, size))
+        correlation = np.fft.irfft(cross / (np.abs(cross) + 1e-9), size)
+        lags = np.arange(-self.block_size, self.max_delay)
+        values = correlation[lags]  # negative lags wrap around to the end
+        best = int(np.argmax(values))
+        if values[best] < 8 * np.std(values):
+            return None
+        return int(lags[best])
+
+    def track_delay(self, delay):
+        """Re-align once two estimates in a row put the echo away from the margin behind the reference"""
+        self.delay = delay
+        shift = delay - self.delay_margin
+        if abs(shift) <= self.block_size // 16:
+            self.moved = None
+        elif self.moved is not None and abs(delay - self.moved) <= self.block_size // 16:
+            self.moved = None
+            self.delay -= self.realign(shift)
+        else:
+            self.moved = delay
+
+    def realign(self, shift):
+        """Delay the reference by ``shift`` samples (advance it if negative), moving the filter taps along
+
+        Returns the shift actually made, which keeps the queue between empty
+        and ``max_delay_duration`` deep.
+        """
+        n = self.block_size
+        with self.lock:
+            if self.position is None:
+                return 0
+            level = self.offset + len(self.buffer) - self.position
+            shift = int(np.clip(shift, -level, self.max_delay - level))
+            if not shift:
+                return 0
+            self.position -= shift
+            past = self.read(self.position - np.arange((self.partitions + 1) * n, 0, -1) * self.rate)
+
+        # The echo now arrives ``shift`` samples earlier relative to the reference
+        impulse = np.fft.irfft(self.weights, n=2 * n, axis=1)[:, :n].reshape(-1)
+        impulse = np.roll(impulse, -shift)
+        if shift > 0:
+            impulse[-shift:] = 0
+        else:
+            impulse[:-shift] = 0
+        padded = np.zeros((self.partitions, 2 * n))
+        padded[:, :n] = impulse.reshape(self.partitions, n)
+        self.weights = np.fft.rfft(padded, axis=1)
+
+        # Rebuild the spectra of the past reference blocks as they read after the shift
+        blocks = past.reshape(self.partitions + 1, n)
+        for p in range(self.partitions):
+            newer = self.partitions - p
+            self.history[p] = np.fft.rfft(np.concatenate([blocks[newer - 1], blocks[newer]]))
+        self.previous_reference = blocks[-1]
+        self.reference_frame = np.concatenate([self.reference_frame, past])[-len(self.reference_frame):]
+        self.recent_microphone = np.zeros(0)
+        self.recent_reference = np.zeros(0)
+        self.realignments += 1
+        return shift
+
+    def process(self, pcm):
+        """Return the int16 microphone chunk ``pcm`` with the echo of the reference removed"""
+        started = time.perf_counter()
+        samples = np.frombuffer(pcm, dtype=np.int16).astype(np.float64)
+        if len(samples) % self.block_size:
+            raise ValueError(f"chunk of {len(samples)} samples is not a multiple of {self.block_size}")
+
+        reference = self.take_reference(len(samples)).astype(np.float64)
+        self.chunk_reference_power = [self.chunk_reference_power[1], float(np.mean(reference * reference))]
+        output = np.empty_like(samples)
+        for start in range(0, len(samples), self.block_size):
+            block = slice(start, start + self.block_size)
+            output[block] = self.process_block(samples[block], reference[block])
+
+        window = self.delay_window + self.max_delay
+        self.recent_microphone = np.concatenate([self.recent_microphone, samples])[-window:]
+        self.recent_reference = np.concatenate([self.recent_reference, reference])[-window:]
+        if len(self.recent_microphone) == window:
+            delay = self.estimate_delay()
+            self.recent_microphone = self.recent_microphone[-self.max_delay:]  # next estimate from fresh audio
+            self.recent_reference = self.recent_reference[-self.max_delay:]
+            if delay is not None:
+                self.track_delay(delay)
+
+        self.processing_time += time.perf_counter() - started
+        return np.clip(np.round(output), -32768, 32767).astype(np.int16).tobytes()
+
+    def double_talk(self, microphone, reference):
+        """Whether the user is talking: the reference explains too little of the microphone's power"""
+        n = self.block_size
+        self.microphone_frame = np.concatenate([self.microphone_frame[n:], microphone])
+        self.reference_frame = np.concatenate([self.reference_frame[n:], reference])
+        size = len(self.reference_frame)
+        microphone_spectrum = np.fft.rfft(self.microphone_frame, size)
+        reference_spectrum = np.fft.rfft(self.reference_frame, size)
+        self.microphone_spectrum = 0.8 * self.microphone_spectrum + 0.2 * np.abs(microphone_spectrum) ** 2
+        self.reference_spectrum = 0.8 * self.reference_spectrum + 0.2 * np.abs(reference_spectrum) ** 2
+        self.cross_spectrum = 0.8 * self.cross_spectrum + 0.2 * reference_spectrum * np.conj(microphone_spectrum)
+        explained = np.sum(np.abs(self.cross_spectrum) ** 2 / (self.reference_spectrum + 1e-9))
+        return explained < self.double_talk_threshold * np.sum(self.microphone_spectrum)
+
+    def process_block(self, microphone, reference):
+        n = self.block_size
+        silent = not np.any(reference) and not np.any(self.previous_reference)
+        spectrum = np.fft.rfft(np.concatenate([self.previous_reference, reference]))
+        self.previous_reference = reference
+        self.history = np.roll(self.history, 1, axis=0)
+        self.history[0] = spectrum
+
+        echo = np.fft.irfft(np.sum(self.weights * self.history, axis=0), n=2 * n)[n:]
+        error = microphone - echo
+        self.blocks += 1
+        double_talk = self.double_talk(microphone, reference)
+
+        if silent:
+            return error
+
+        self.active_blocks += 1
+        if double_talk:
+            self.double_talk_blocks += 1
+            return error  # near-end speech: keep the filter, pass the user's voice through
+
+        # The user's voice is neither echo nor residual, so only echo-only blocks feed the ERLE
+        microphone_power = float(np.mean(microphone * microphone)) + 1e-6
+        error_power = float(np.mean(error * error)) + 1e-6
+        self.echo_power = 0.98 * self.echo_power + 0.02 * microphone_power
+        self.residual_power = 0.98 * self.residual_power + 0.02 * error_power
+        self.path_reference_power = 0.98 * self.path_reference_power + 0.02 * float(np.mean(reference * reference))
+
+        # Robust NLMS: an error burst far above the recent residual adapts as if it were at the clip level
+        if self.error_scale is None:
+            self.error_scale = error_power
+        limit = self.error_clip * self.error_scale
+        adapting = error * np.sqrt(limit / error_power) if error_power > limit else error
+        self.error_scale = 0.95 * self.error_scale + 0.05 * min(error_power, limit)
+
+        self.power = 0.9 * self.power + 0.1 * np.abs(spectrum) ** 2
+        norm = self.partitions * self.power
+        norm += 0.01 * np.mean(norm) + 1e-6  # bins the reference barely excites must not take huge steps
+        error_spectrum = np.fft.rfft(np.concatenate([np.zeros(n), adapting]))
+        gradient = np.conj(self.history) * (error_spectrum / norm)
+
+        # Overlap-save constraint: keep each partition's impulse response causal and n long
+        impulse = np.fft.irfft(gradient, n=2 * n, axis=1)
+        impulse[:, n:] = 0
+        self.weights += self.step_size * np.fft.rfft(impulse, axis=1)
+        return error
+
+    @property
+    def erle(self):
+        """Echo return loss enhancement in dB, averaged over echo-only blocks"""
+        if self.residual_power <= 0:
+            return 0.0
+        return float(10 * np.log10(self.echo_power / self.residual_power))
+
+    def expected_residual(self):
+        """RMS of the echo expected to be left in the latest chunk, or None before any echo-only block
+
+        The previous chunk's reference counts as well, since its echo arrives late.
+        """
+        if self.path_reference_power <= 0:
+            return None
+        gain = self.residual_power / self.path_reference_power
+        return float(np.sqrt(max(self.chunk_reference_power) * gain))
+
+    @property
+    def converged(self):
+        return self.erle >= self.converged_erle
+
+    def stats(self):
+        audio_time = self.blocks * self.block_size / float(self.sample_rate)
+        return {
+            "erle_db": round(self.erle, 1),
+            "active_seconds": round(self.active_blocks * self.block_size / float(self.sample_rate), 1),
+            "double_talk_seconds": round(self.double_talk_blocks * self.block_size / float(self.sample_rate), 1),
+            "delay_ms": round(1000.0 * self.delay / self.sample_rate, 1) if self.delay is not None else None,
+            "drift_ppm": int(round(1e6 * (self.rate - 1.0))),
+            "underruns": self.underruns,
+            "realignments": self.realignments,
+            "realtime_factor": round(self.processing_time / audio_time, 3) if audio_time else 0.0,
+        }
+
+
+def simulated_speech(duration, sample_rate, seed):
+    """Voiced harmonic bursts with a syllable-rate envelope, a stand-in for TTS output"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration * sample_rate)) / float(sample_rate)
+    pitch = 140 + 30 * np.sin(2 * np.pi * 0.7 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 12))
+    envelope = np.clip(np.sin(2 * np.pi * 4 * t + rng.uniform(0, np.pi)), 0, None) ** 2
+    envelope *= (np.sin(2 * np.pi * 0.25 * t) > -0.3)  # pauses between phrases
+    noise = rng.normal(0, 0.05, len(t))
+    return (voiced + noise) * envelope * 8000
+
+
+def simulated_room(rng, delay=0.03, gain=1.5, sample_rate=16000):
+    """Device/acoustic delay followed by a decaying 120 ms reverberant tail"""
+    length = int(0.12 * sample_rate)
+    tail = rng.normal(0, 1, length) * np.exp(-np.arange(length) / (0.03 * sample_rate))
+    tail[0] = 4
+    return np.concatenate([np.zeros(int(delay * sample_rate)), tail / np.sum(np.abs(tail)) * gain])
+
+
+def benchmark(duration=20.0, sample_rate=16000, chunk_size=1024, double_talk=True, drift=0.0, path_change=False,
+              output_chunk=320, output_latency=0.04, input_latency=0.01):
+    """Cancel a simulated room echo and report ERLE and real-time factor
+
+    Playback runs on its own clock, ``drift`` (e.g. 0.002) faster than the
+    microphone's, and is handed over ``output_chunk`` samples at a time
+    ``output_latency`` before it is heard; microphone chunks arrive
+    ``input_latency`` after they are captured. With ``path_change`` the room
+    changes halfway through, as if the speaker were moved and turned up.
+    """
+    rng = np.random.default_rng(0)
+    count = int(duration * sample_rate) // chunk_size * chunk_size
+    played = simulated_speech(duration * (1 + abs(drift)) + 1, sample_rate, seed=1)
+    # Playback as heard on the microphone clock; resampled through 8x oversampling so the simulation stays exact
+    oversampled = np.fft.irfft(np.fft.rfft(played), 8 * len(played)) * 8
+    heard = np.interp(np.arange(count) * (1 + drift) * 8, np.arange(len(oversampled)), oversampled)
+
+    echo = np.convolve(heard, simulated_room(rng, sample_rate=sample_rate))[:count]
+    change = count // 2 if path_change else count
+    if path_change:
+        moved = simulated_room(rng, delay=0.05, gain=2.0, sample_rate=sample_rate)
+        echo[change:] = np.convolve(heard, moved)[:count][change:]
+    microphone = echo + rng.normal(0, 30, count)
+
+    near_end = np.zeros(count)
+    if double_talk:
+        start, end = int(0.7 * count), int(0.8 * count)
+        near_end[start:end] = simulated_speech((end - start) / float(sample_rate), sample_rate, seed=2)
+        microphone += near_end
+
+    canceller = EchoCanceller(sample_rate=sample_rate)
+    reference_pcm = np.clip(played, -32768, 32767).astype(np.int16)
+    microphone_pcm = np.clip(microphone, -32768, 32767).astype(np.int16)
+    output_rate = sample_rate * (1 + drift)
+
+    started = time.perf_counter()
+    cleaned = []
+    handed = 0
+    for start in range(0, count, chunk_size):
+        now = (start + chunk_size) / float(sample_rate) + input_latency
+        while (handed / output_rate) - output_latency <= now:  # everything the output device has asked for by now
+            canceller.add_reference(reference_pcm[handed:handed + output_chunk].tobytes())
+            handed += output_chunk
+        cleaned.append(np.frombuffer(canceller.process(microphone_pcm[start:start + chunk_size].tobytes()), dtype=np.int16))
+    elapsed = time.perf_counter() - started
+    cleaned = np.concatenate(cleaned).astype(np.float64)
+
+    def erle(begin, end):
+        mask = near_end[begin:end] == 0
+        residual = cleaned[begin:end][mask] - microphone[begin:end][mask] + echo[begin:end][mask]
+        return 10 * np.log10(np.sum(echo[begin:end][mask] ** 2) / (np.sum(residual ** 2) + 1e-6))
+
+    second = sample_rate
+    print(f"{count / float(sample_rate):.1f}s of audio processed in {elapsed:.2f}s "
+          f"(real-time factor {elapsed * sample_rate / count:.3f}, {count / float(sample_rate) / elapsed:.0f}x faster than real time)")
+    print("ERLE per 2 s: " + " ".join(f"{erle(begin, begin + 2 * second):.1f}" for begin in range(0, count - 2 * second + 1, 2 * second)))
+    print(f"ERLE first second: {erle(0, second):.1f} dB, after convergence: {erle(min(5 * second, change // 2), change):.1f} dB"
+          + (f", after the room changed: {erle(change + 5 * second, count):.1f} dB" if path_change else ""))
+    print(f"ERLE over the last 5 s: {erle(count - 5 * second, count):.1f} dB, running estimate: {canceller.erle:.1f} dB")
+    if double_talk:
+        start, end = int(0.7 * count), int(0.8 * count)
+        kept = np.sum(near_end[start:end] * cleaned[start:end]) / np.sum(near_end[start:end] ** 2)
+        print(f"Near-end speech kept during double talk: {kept:.2f} of its amplitude")
+    print(f"Canceller: {canceller.stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the echo canceller on a simulated room")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of simulated playback")
+    parser.add_argument("--no-double-talk", action="store_true", help="leave out the near-end speech segment")
+    parser.add_argument("--drift", type=float, default=0.0, help="playback clock rate error, e.g. 0.002")
+    parser.add_argument("--path-change", action="store_true", help="move and turn up the speaker halfway through")
+    args = parser.parse_args()
+    benchmark(duration=args.duration, double_talk=not args.no_double_talk, drift=args.drift,
+              path_change=args.path_change)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,10 +3,29 @@ import os
 import numpy as np
 from datetime import datetime
 from dotenv import load_dotenv
-from gtts import gTTS
 from pydub import AudioSegment
 from pydub.playback import play
 from commands import COMMANDS
+from audio_stream import MicrophoneStream
+from audio_output import AudioOutput, Playback
+from barge_in import BargeInMonitor
+from echo_cancel import EchoCanceller
+from vad import VoiceActivityDetector, VoiceActivitySegmenter, NoiseFloorTracker
+from wakeword import WakeWordSpotter
+from recognition import LocaleStats, SpokenText, prepare_utterance
+from asr import GoogleBackend, WhisperBackend, FallbackBackend
+from resilience import Guard, CircuitBreaker
+from http_transport import HttpTransport, GOOGLE_STT_ENDPOINT, GOOGLE_TTS_ENDPOINT
+from pipeline import SegmentPipeline
+from tts_cache import SpeechCache
+from response_cache import ResponseCache, normalize_query
+from speculation import SpeculativePrefetch
+from tts import (
+    split_sentences, stream_sentences, play_sentences,
+    GoogleTTSBackend, EspeakBackend, Tacotron2Backend, FallbackSpeechBackend
+)
+from tts_server import ServerBackend
+from concurrent.futures import ThreadPoolExecutor
 import vertexai
 from vertexai.generative_models import GenerativeModel
 from google.cloud import aiplatform
@@ -50,23 +69,220 @@ DYNAMIC_ENERGY_THRESHOLD = True
 PAUSE_THRESHOLD = 2.0  # waits 2 seconds of silence
 PHRASE_THRESHOLD = 0.3  # more sensitive to speech start
 NON_SPEAKING_DURATION = 1.0  # allows quiet speech
+PERSISTENT_STREAM = True  # keep one microphone stream open instead of reopening it per listen
+PRE_ROLL_DURATION = 0.5  # seconds of buffered audio handed to each listener
+RING_BUFFER_DURATION = 30  # seconds of audio retained by the capture ring buffer
+USE_VAD = True  # segment speech with the NumPy voice activity detector
+VAD_FRAME_DURATION = 0.02  # seconds per VAD frame
+VAD_HANGOVER_DURATION = 0.2  # seconds speech is held after the last voiced frame
+TRACK_NOISE_FLOOR = True  # follow the noise floor from the live stream instead of calibrating
+LOCAL_WAKEWORD = True  # spot the wake word on-device once templates are enrolled
+WAKEWORD_TEMPLATES = "wakeword_templates.npz"  # enroll with: python wakeword.py "hey eva"
+WAKEWORD_AUTO_ENROLL = True  # enroll cloud-confirmed wake words until the spotter is ready
+CONCURRENT_LOCALES = True  # query all language variants at once, first confident answer wins
+RECOGNITION_DEADLINE = 6  # seconds allowed per recognition request
+CONFIDENCE_THRESHOLD = 0.3  # minimum confidence to accept a locale's transcript
+ADAPTIVE_LOCALES = True  # reorder and prune language variants from past recognitions
+LOCALE_STATS_PATH = "locale_stats_en.json"  # per-speaker locale statistics of this module
+LANGUAGE_VARIANTS = ['en-US', 'en-GB', 'en-IN']  # locales tried after the requested one
+ASR_BACKEND = os.getenv("ASR_BACKEND", "google")  # "google" or "whisper"
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "base")  # tiny, base, small, ...
+WHISPER_THREADS = int(os.getenv("WHISPER_THREADS", "4"))  # CPU threads for local inference
+WHISPER_QUANTIZE = os.getenv("WHISPER_QUANTIZE", "0") == "1"  # int8 weights for CPU-only boxes
+WHISPER_CACHE_DIR = os.getenv("WHISPER_CACHE_DIR")  # where converted int8 weights are kept
+PIPELINED_LISTEN = True  # keep capturing command segments while earlier ones are transcribed
+RECOGNITION_WORKERS = 2  # segments transcribed in parallel by the pipeline
+TTS_BACKEND = os.getenv("TTS_BACKEND", "gtts")  # "gtts", "espeak", "tacotron2" or "server"
+TACOTRON2_CHECKPOINT = os.getenv("TACOTRON2_CHECKPOINT")  # trained voice from ttsmodel/training_code
+WAVEGLOW_CHECKPOINT = os.getenv("WAVEGLOW_CHECKPOINT", "waveglow_256channels_universal_v5.pt")
+TACOTRON2_CODE_DIR = os.getenv("TACOTRON2_CODE_DIR", "TTS-TT2")  # checkout of the training repository
+TTS_DEVICE = os.getenv("TTS_DEVICE")  # "cpu" or "cuda"; defaults to cuda when available
+TTS_THREADS = int(os.getenv("TTS_THREADS", "4"))  # CPU threads for local synthesis
+TTS_SERVER_SOCKET = os.getenv("TTS_SERVER_SOCKET", "/tmp/eva-tts.sock")  # shared synthesis server, see tts_server.py
+TTS_CACHE_DIR = "tts_cache"  # synthesized prompts kept across restarts; None disables the disk tier
+TTS_CACHE_MEMORY_MB = 64  # decoded speech kept in memory
+TTS_CACHE_DISK_MB = 256  # synthesized speech kept on disk, least recently used evicted first
+WARM_UP_WORKERS = 8  # prompts synthesized in parallel at startup
+GREETING_HOURS = (8, 13, 17, 22)  # one hour from each greeting period, for warm-up
+STREAM_SPEECH = True  # speak long answers sentence by sentence as they are synthesized
+STREAM_VERTEX = True  # start speaking Gemini's answer while it is still being generated
+RESPONSE_CACHE = True  # reuse Gemini's answers to questions asked before
+RESPONSE_CACHE_PATH = "response_cache_en.json"  # answers kept across restarts; None keeps them in memory only
+RESPONSE_CACHE_TTL = 24 * 3600  # seconds a cached answer stays valid; time, weather and news questions are never cached
+RESPONSE_CACHE_SIZE = 256  # answers kept, least recently asked evicted first
+SPECULATIVE_VERTEX = False  # ask Gemini about the command so far while the user is still dictating; costs extra requests
+SPECULATION_LIMIT = 2  # speculative Gemini requests in flight at once
+VERTEX_DEADLINE = 20  # seconds for a Gemini answer, or between the pieces of a streamed one
+TTS_DEADLINE = 8  # seconds for one gTTS request
+HEDGE_PERCENTILE = 95  # resend STT and gTTS requests slower than this latency percentile; None disables
+BREAKER_ERROR_RATE = 0.5  # share of failed or over-budget calls that opens a service's circuit
+BREAKER_COOLDOWN = 30  # seconds before a trial call to a service whose circuit is open
+STT_LATENCY_BUDGET = 4  # seconds; slower recognitions count against Google's circuit
+TTS_LATENCY_BUDGET = 4  # seconds; slower gTTS requests count against its circuit
+VERTEX_LATENCY_BUDGET = 12  # seconds; slower Gemini answers count against its circuit
+STT_FALLBACK = "whisper"  # local recognizer while Google speech recognition is failing; None disables
+TTS_FALLBACK = "espeak"  # local voice while gTTS is failing; None disables
+STT_ENDPOINT = os.getenv("STT_ENDPOINT", GOOGLE_STT_ENDPOINT)  # override to test against a local stand-in server
+TTS_ENDPOINT = os.getenv("TTS_ENDPOINT", GOOGLE_TTS_ENDPOINT)  # override to test against a local stand-in server
+HTTP_POOL_SIZE = 8  # keep-alive connections kept open per host
+HTTP_WARM_CONNECTIONS = 2  # connections opened to each cloud service at startup; 0 disables
+TTS_LOOKAHEAD = 1  # sentences synthesized ahead of the one playing
+STREAM_SYNTHESIS = True  # start playing local voices after their first vocoded chunk
+PERSISTENT_OUTPUT = True  # keep one output stream open instead of opening a player per utterance
+OUTPUT_SAMPLE_RATE = 24000  # gTTS renders at 24 kHz, so its speech is never resampled
+OUTPUT_PREBUFFER_DURATION = 0.1  # seconds queued before a sound starts playing
+BARGE_IN = True  # stop speaking when the user talks over the assistant
+BARGE_IN_DURATION = 0.3  # seconds of speech over playback that stop it
+BARGE_IN_THRESHOLD_RATIO = 2.0  # barge-in speech must be this much louder than the noise threshold and the residual echo
+ECHO_CANCELLATION = True  # subtract the assistant's own playback from the microphone signal
+FULL_DUPLEX = True  # keep listening while speaking, but only once the echo canceller has converged
+AEC_CONVERGED_ERLE = 15  # dB of echo removal needed before listening while speaking
+
+# Fixed prompts, pre-rendered into the speech cache by warm_up()
+PROMPTS = {
+    "listening": f"I'm Listening {USER}. Say your command and then say 'finished eva' when finished.",
+    "still_listening": "I'm still listening. Continue or say 'finished eva'.",
+    "nothing_heard": "I didn't hear anything. Please try again.",
+    "missed_part": "I didn't catch that part. Please continue or say 'done'.",
+    "unclear": "I couldn't hear you clearly. Please try again.",
+    "cancelled": "Command cancelled. Give me a new command.",
+    "no_command": "You didn't give me a command. Please try again.",
+    "farewell": f'Good bye {USER}, have an amazing day!',
+    "got_it": "Got it. Continue or say 'done'.",
+    "still_listening_short": "Still listening...",
+    "incomplete": "I didn't receive a complete command. Please try again.",
+    "listen_error": "Sorry, I had trouble hearing you. Let's try again.",
+    "processing": "Processing your request...",
+    "vertex_error": "I'm having trouble processing that request right now.",
+}
+
+# Keep-alive connections shared by Google speech recognition and gTTS
+http_transport = HttpTransport(pool_maxsize=HTTP_POOL_SIZE)
+
+# Deadlines, hedging and circuit breakers for the cloud services
+stt_guard = Guard(
+    "google-stt",
+    deadline=RECOGNITION_DEADLINE,
+    hedge_percentile=HEDGE_PERCENTILE,
+    breaker=CircuitBreaker(BREAKER_ERROR_RATE, latency_budget=STT_LATENCY_BUDGET, cooldown=BREAKER_COOLDOWN)
+)
+tts_guard = Guard(
+    "gtts",
+    deadline=TTS_DEADLINE,
+    hedge_percentile=HEDGE_PERCENTILE,
+    breaker=CircuitBreaker(BREAKER_ERROR_RATE, latency_budget=TTS_LATENCY_BUDGET, cooldown=BREAKER_COOLDOWN)
+)
+vertex_guard = Guard(
+    "vertex",
+    deadline=VERTEX_DEADLINE,
+    breaker=CircuitBreaker(BREAKER_ERROR_RATE, latency_budget=VERTEX_LATENCY_BUDGET, cooldown=BREAKER_COOLDOWN)
+)  # not hedged: every duplicate answer is billed
+guards = [stt_guard, tts_guard, vertex_guard]
 
 class NoiseRobustRecognizer:
     def __init__(self):
         self.recognizer = sr.Recognizer()
-        self.microphone = sr.Microphone(sample_rate=SAMPLE_RATE)
+        self.locale_stats = LocaleStats(LOCALE_STATS_PATH, USER) if ADAPTIVE_LOCALES else None
+        if ASR_BACKEND == "whisper":
+            self.backend = WhisperBackend(
+                model_size=WHISPER_MODEL,
+                threads=WHISPER_THREADS,
+                quantize=WHISPER_QUANTIZE,
+                cache_dir=WHISPER_CACHE_DIR
+            )
+        else:
+            self.backend = GoogleBackend(
+                self.recognizer,
+                concurrent=CONCURRENT_LOCALES,
+                deadline=RECOGNITION_DEADLINE,
+                threshold=CONFIDENCE_THRESHOLD,
+                locale_stats=self.locale_stats,
+                guard=stt_guard,
+                transport=http_transport,
+                endpoint=STT_ENDPOINT
+            )
+            if STT_FALLBACK == "whisper":
+                self.backend = FallbackBackend(
+                    self.backend,
+                    lambda: WhisperBackend(
+                        model_size=WHISPER_MODEL,
+                        threads=WHISPER_THREADS,
+                        quantize=WHISPER_QUANTIZE,
+                        cache_dir=WHISPER_CACHE_DIR
+                    ),
+                    stt_guard
+                )
+        self.stream = None
+        self.microphone = None
+        self.echo_canceller = None
+        if PERSISTENT_STREAM:
+            self.stream = MicrophoneStream(sample_rate=SAMPLE_RATE, buffer_duration=RING_BUFFER_DURATION)
+            if ECHO_CANCELLATION:
+                # Reference comes from the output stream once it is open
+                self.echo_canceller = EchoCanceller(
+                    sample_rate=SAMPLE_RATE,
+                    reference_rate=OUTPUT_SAMPLE_RATE,
+                    converged_erle=AEC_CONVERGED_ERLE
+                )
+                self.stream.chunk_processors.append(self.echo_canceller.process)
+            self.stream.start()
+        else:
+            self.microphone = sr.Microphone(sample_rate=SAMPLE_RATE)
+        self.segmenter = None
+        if USE_VAD:
+            detector = VoiceActivityDetector(
+                sample_rate=SAMPLE_RATE,
+                frame_duration=VAD_FRAME_DURATION,
+                hangover_duration=VAD_HANGOVER_DURATION
+            )
+            self.segmenter = VoiceActivitySegmenter(
+                detector,
+                pause_threshold=PAUSE_THRESHOLD,
+                phrase_threshold=PHRASE_THRESHOLD,
+                non_speaking_duration=NON_SPEAKING_DURATION
+            )
+        self.noise_tracker = None
+        if TRACK_NOISE_FLOOR and (self.stream is not None or self.segmenter is not None):
+            self.noise_tracker = NoiseFloorTracker(
+                VoiceActivityDetector(
+                    sample_rate=SAMPLE_RATE,
+                    frame_duration=VAD_FRAME_DURATION,
+                    hangover_duration=VAD_HANGOVER_DURATION
+                ),
+                initial_threshold=ENERGY_THRESHOLD
+            )
+            self.noise_tracker.add_target(self.recognizer)
+            if self.segmenter is not None:
+                self.noise_tracker.add_target(self.segmenter.detector)
+            if self.stream is not None:
+                self.stream.chunk_listeners.append(self.noise_tracker.process)
+            else:
+                self.segmenter.noise_tracker = self.noise_tracker
         self.setup_microphone()
+
+    def audio_source(self):
+        """Buffered source from the persistent stream, or the raw microphone"""
+        if self.stream is not None:
+            return self.stream.source(pre_roll=PRE_ROLL_DURATION)
+        return self.microphone
         
     def setup_microphone(self):
         """Configure microphone with noise handling"""
-        print("Calibrating microphone for ambient noise...")
-        with self.microphone as source:
-            # Longer calibration for better noise baseline
-            self.recognizer.adjust_for_ambient_noise(source, duration=2)
+        if self.noise_tracker is None:
+            print("Calibrating microphone for ambient noise...")
+            with self.audio_source() as source:
+                # Longer calibration for better noise baseline
+                self.recognizer.adjust_for_ambient_noise(source, duration=2)
             
-        # Enhanced audio settings
-        self.recognizer.energy_threshold = ENERGY_THRESHOLD
-        self.recognizer.dynamic_energy_threshold = DYNAMIC_ENERGY_THRESHOLD
+            # Enhanced audio settings
+            self.recognizer.energy_threshold = ENERGY_THRESHOLD
+            self.recognizer.dynamic_energy_threshold = DYNAMIC_ENERGY_THRESHOLD
+            if self.segmenter is not None:
+                self.segmenter.detector.energy_threshold = self.recognizer.energy_threshold
+        else:
+            # The noise tracker owns the threshold and keeps following the room
+            self.recognizer.dynamic_energy_threshold = False
+        
         self.recognizer.pause_threshold = PAUSE_THRESHOLD
         self.recognizer.phrase_threshold = PHRASE_THRESHOLD
         self.recognizer.non_speaking_duration = NON_SPEAKING_DURATION
@@ -76,12 +292,14 @@ class NoiseRobustRecognizer:
     def listen_with_noise_filtering(self, timeout=None, phrase_time_limit=None):
         """Enhanced listening with noise filtering"""
         try:
-            with self.microphone as source:
-                # Quick ambient noise adjustment
-                self.recognizer.adjust_for_ambient_noise(source, duration=0.2)
+            with self.audio_source() as source:
+                # Quick ambient noise adjustment, unless the noise tracker already follows
+                # the room; the persistent stream's pre-roll would be swallowed by it too
+                if self.stream is None and self.noise_tracker is None:
+                    self.recognizer.adjust_for_ambient_noise(source, duration=0.2)
                 
                 # Listen with enhanced settings
-                audio = self.recognizer.listen(
+                audio = self.capture(
                     source, 
                     timeout=timeout,
                     phrase_time_limit=phrase_time_limit
@@ -96,12 +314,14 @@ class NoiseRobustRecognizer:
     def listen_for_segment(self, timeout=None, phrase_time_limit=8):
         """Listen for a segment of speech (part of a longer command)"""
         try:
-            with self.microphone as source:
-                # Quick ambient noise adjustment
-                self.recognizer.adjust_for_ambient_noise(source, duration=0.2)
+            with self.audio_source() as source:
+                # Quick ambient noise adjustment, unless the noise tracker already follows
+                # the room; the persistent stream's pre-roll would be swallowed by it too
+                if self.stream is None and self.noise_tracker is None:
+                    self.recognizer.adjust_for_ambient_noise(source, duration=0.2)
                 
                 # Listen with enhanced settings
-                audio = self.recognizer.listen(
+                audio = self.capture(
                     source, 
                     timeout=timeout,
                     phrase_time_limit=phrase_time_limit
@@ -113,38 +333,49 @@ class NoiseRobustRecognizer:
             print(f"Error in segment listening: {e}")
             return None
     
+    def mute(self):
+        """Keep listeners from hearing the assistant's own voice"""
+        if FULL_DUPLEX and self.echo_canceller is not None and self.echo_canceller.converged:
+            return  # the echo is cancelled, so keep listening while speaking
+        if self.stream is not None:
+            self.stream.mute()
+    
+    def unmute(self):
+        """Resume listening past everything captured while muted"""
+        if self.stream is not None:
+            self.stream.unmute()
+    
+    def interrupt_listening(self):
+        """End any capture in progress early"""
+        if self.stream is not None:
+            self.stream.interrupt()
+    
+    def capture(self, source, timeout=None, phrase_time_limit=None):
+        """Cut one phrase from the source with the VAD, or the recognizer's energy loop
+
+        The audio is stamped with the wall-clock span it covers, so the
+        assistant's own words can be told apart from the user's.
+        """
+        if self.segmenter is not None:
+            audio = self.segmenter.listen(source, timeout=timeout, phrase_time_limit=phrase_time_limit)
+        else:
+            audio = self.recognizer.listen(source, timeout=timeout, phrase_time_limit=phrase_time_limit)
+        ended = time.time()
+        audio.captured = (ended - len(audio.frame_data) / float(audio.sample_rate * audio.sample_width), ended)
+        return audio
+    
+    @property
+    def last_locale(self):
+        """Locale that produced the most recent transcript"""
+        return self.backend.last_locale
+    
     def recognize_with_confidence(self, audio, language='en-US'):
         """Speech recognition with confidence scoring"""
         try:
-            # Try Google Speech Recognition with language variants
-            languages_to_try = [language, 'en-US', 'en-GB', 'en-IN']
-            
-            for lang in languages_to_try:
-                try:
-                    # Get recognition results
-                    result = self.recognizer.recognize_google(audio, language=lang, show_all=True)
-                    
-                    if result and isinstance(result, dict) and 'alternative' in result:
-                        # Get the best alternative with confidence
-                        alternatives = result['alternative']
-                        if alternatives:
-                            best_result = alternatives[0]
-                            confidence = best_result.get('confidence', 0)
-                            transcript = best_result.get('transcript', '')
-                            
-                            # Only return if confidence is reasonable
-                            if confidence > 0.3 or len(alternatives) == 1:
-                                return transcript.lower(), confidence
-                                
-                except sr.UnknownValueError:
-                    continue
-                except sr.RequestError:
-                    continue
-            
-            # Fallback to simple recognition
-            result = self.recognizer.recognize_google(audio, language=language)
-            return result.lower(), 0.8
+            # Trimmed and compressed once, shared by every locale attempt and the fallback
+            audio = prepare_utterance(audio, self.recognizer.energy_threshold)
             
+            return self.backend.recognize(audio, language, LANGUAGE_VARIANTS)
         except sr.UnknownValueError:
             return None, 0
         except sr.RequestError as e:
@@ -154,34 +385,312 @@ class NoiseRobustRecognizer:
 # Global recognizer instance
 recognizer = NoiseRobustRecognizer()
 
+# Offline wake word engine, fed from the persistent microphone stream
+spotter = None
+if LOCAL_WAKEWORD and recognizer.stream is not None:
+    spotter = WakeWordSpotter(WAKEWORD, WAKEWORD_TEMPLATES, sample_rate=SAMPLE_RATE)
+    spotter.start(recognizer.stream)
+    if recognizer.noise_tracker is not None:
+        recognizer.noise_tracker.add_target(spotter)
+
+# What the assistant said recently, kept out of transcripts captured while it played
+spoken_text = SpokenText()
+
+# Synthesized speech, reused for repeated prompts and command responses
+speech_cache = SpeechCache(
+    TTS_CACHE_DIR,
+    max_memory_bytes=TTS_CACHE_MEMORY_MB * 1024 * 1024,
+    max_disk_bytes=TTS_CACHE_DISK_MB * 1024 * 1024
+)
 
-def vertex(prompt_text):
+# Gemini answers to repeated questions, keyed on the normalized question
+response_cache = None
+if RESPONSE_CACHE:
+    response_cache = ResponseCache(RESPONSE_CACHE_PATH, ttl=RESPONSE_CACHE_TTL, max_entries=RESPONSE_CACHE_SIZE)
+
+# Answers to the command so far, fetched while the user says 'finished eva'
+prefetch = None
+if SPECULATIVE_VERTEX:
+    prefetch = SpeculativePrefetch(
+        lambda command: vertex(command, cache=False),
+        key=lambda command: normalize_query(command, 'en'),
+        max_outstanding=SPECULATION_LIMIT
+    )
+
+# Speech engine, loaded once; gTTS stands in if a local model cannot be loaded
+tts_backend = None
+try:
+    if TTS_BACKEND == "tacotron2":
+        tts_backend = Tacotron2Backend(
+            TACOTRON2_CHECKPOINT,
+            WAVEGLOW_CHECKPOINT,
+            code_dir=TACOTRON2_CODE_DIR,
+            device=TTS_DEVICE,
+            threads=TTS_THREADS
+        )
+    elif TTS_BACKEND == "espeak":
+        tts_backend = EspeakBackend()
+    elif TTS_BACKEND == "server":
+        tts_backend = ServerBackend(TTS_SERVER_SOCKET)
+except Exception as e:
+    print(f"Error loading {TTS_BACKEND} speech engine, falling back to gTTS: {e}")
+if tts_backend is None:
+    tts_backend = GoogleTTSBackend(
+        guard=tts_guard,
+        timeout=TTS_DEADLINE,
+        transport=http_transport,
+        endpoint=TTS_ENDPOINT
+    )
+    if TTS_FALLBACK == "espeak":
+        tts_backend = FallbackSpeechBackend(tts_backend, EspeakBackend)
+
+# Output device opened once; pydub's player is only used if it cannot be opened
+output = None
+if PERSISTENT_OUTPUT:
     try:
-        # Add instruction to keep response short
-        prompt = f"{prompt_text.strip()}\nPlease respond briefly and clearly."
+        output = AudioOutput(
+            sample_rate=OUTPUT_SAMPLE_RATE,
+            prebuffer_duration=OUTPUT_PREBUFFER_DURATION
+        ).start()
+    except Exception as e:
+        print(f"Error opening audio output, falling back to pydub playback: {e}")
+
+if output is not None and recognizer.echo_canceller is not None:
+    output.add_reference_listener(recognizer.echo_canceller.add_reference)
 
-        response = model.generate_content([prompt])
-        raw_text = response.text
+# Talking over the assistant stops its speech and is heard as the next command segment
+barge_in = None
+if BARGE_IN and output is not None and recognizer.stream is not None:
+    barge_in = BargeInMonitor(
+        VoiceActivityDetector(
+            sample_rate=SAMPLE_RATE,
+            frame_duration=VAD_FRAME_DURATION,
+            hangover_duration=VAD_HANGOVER_DURATION
+        ),
+        recognizer.stream,
+        output,
+        min_speech_duration=BARGE_IN_DURATION,
+        threshold_ratio=BARGE_IN_THRESHOLD_RATIO,
+        echo_canceller=recognizer.echo_canceller
+    )
+    recognizer.stream.chunk_listeners.append(barge_in.process)
+    if recognizer.noise_tracker is not None:
+        recognizer.noise_tracker.add_target(barge_in.detector)
 
-        # Remove all punctuation except periods and commas
-        cleaned_text = re.sub(r"[^\w\s\.,?!]", "", raw_text)
 
-        return cleaned_text.strip()
+def vertex_prompt(prompt_text):
+    # Add instruction to keep response short
+    return f"{prompt_text.strip()}\nPlease respond briefly and clearly."
+
+def clean_response(raw_text):
+    # Remove all punctuation except periods and commas
+    return re.sub(r"[^\w\s\.,?!]", "", raw_text)
+
+def vertex(prompt_text, cache=True):
+    try:
+        response = vertex_guard.call(model.generate_content, [vertex_prompt(prompt_text)])
+        answer = clean_response(response.text).strip()
+        if cache and response_cache is not None:
+            response_cache.put(prompt_text, 'en', answer)
+        return answer
     except Exception as e:
         print(f"Error with Vertex AI: {e}")
-        return "I'm having trouble processing that request right now."
+        return PROMPTS["vertex_error"]
 
-def speech(text):
-    """Convert text to speech and play it"""
+def vertex_stream(prompt_text):
+    """Yield Gemini's answer in cleaned pieces as they are generated"""
+    pieces = []
+    complete = False
     try:
-        text_to_speech = gTTS(text=text, lang='en')
-        filename = 'sound.mp3'
-        text_to_speech.save(filename)
-        sound = AudioSegment.from_file(filename)
-        play(sound)
-        os.remove(filename)
+        for chunk in vertex_guard.stream(model.generate_content, [vertex_prompt(prompt_text)], stream=True):
+            try:
+                text = clean_response(chunk.text)
+            except ValueError:
+                continue  # a chunk without text, e.g. only safety ratings
+            if text:
+                pieces.append(text)
+                yield text
+        complete = True
     except Exception as e:
+        print(f"Error with Vertex AI: {e}")
+    if not pieces:
+        yield PROMPTS["vertex_error"]
+    elif complete and response_cache is not None:
+        # Only whole answers are cached; a barge-in closes the stream before this
+        response_cache.put(prompt_text, 'en', "".join(pieces).strip())
+
+def synthesize_cached(text):
+    """Synthesized speech for text from the speech cache, rendering it on a miss
+
+    Answers are kept in memory only; warm_up() writes the fixed prompts to disk.
+    """
+    return speech_cache.get_or_synthesize(text, 'en', tts_backend.voice, synthesize, persist=False)
+
+def synthesize(text):
+    """Render text to PCM in memory with the configured speech engine"""
+    return tts_backend.synthesize(text, 'en')
+
+def release_microphone(playback):
+    """Listen again once nothing else is queued to play"""
+    if not output.busy:
+        recognizer.unmute()
+
+def play_sound(sound, block=True):
+    """Play decoded speech with the microphone muted and return its Playback handle"""
+    recognizer.mute()
+    if output is None:
+        playback = Playback()
+        try:
+            play(sound)
+        finally:
+            recognizer.unmute()
+            playback.finish()
+        return playback
+    
+    playback = output.play(sound, block=False)
+    playback.add_done_callback(release_microphone)
+    if block:
+        playback.wait()
+    return playback
+
+def speech(text, block=True):
+    """Convert text to speech and play it; returns a Playback handle, or None on error
+
+    With ``block=False`` the caller carries on while the assistant speaks.
+    """
+    ended = None
+    try:
+        sound = speech_cache.get(text, 'en', tts_backend.voice)
+        if sound is None and STREAM_SYNTHESIS and output is not None and hasattr(tts_backend, "stream"):
+            ended = spoken_text.add(text)
+            playback = play_synthesis_stream(text, block=block)
+        else:
+            if sound is None:
+                sound = synthesize(text)
+                speech_cache.put(text, 'en', tts_backend.voice, sound, persist=text in fixed_texts())
+            ended = spoken_text.add(text)
+            playback = play_sound(sound, block=block)
+        playback.add_done_callback(ended)
+        return playback
+    except Exception as e:
+        if ended is not None:
+            ended()
         print(f"Error with text-to-speech: {e}")
+        return None
+
+def play_synthesis_stream(text, block=True):
+    """Play speech while the engine is still synthesizing it, caching it once complete"""
+    chunks = []
+    
+    def produce():
+        for pcm in tts_backend.stream(text, 'en'):
+            chunks.append(pcm)
+            yield pcm
+        # Only complete utterances are cached; a barge-in abandons the generator before this
+        speech_cache.put(text, 'en', tts_backend.voice, AudioSegment(
+            data=b"".join(chunks),
+            sample_width=2,
+            frame_rate=tts_backend.sample_rate,
+            channels=1
+        ), persist=text in fixed_texts())
+    
+    recognizer.mute()
+    playback = output.play_stream(produce(), tts_backend.sample_rate, block=False)
+    playback.add_done_callback(release_microphone)
+    if block:
+        playback.wait()
+    return playback
+
+def speech_streamed(text):
+    """Speak a long answer sentence by sentence, synthesizing the next while one plays"""
+    sentences = split_sentences(text)
+    if len(sentences) <= 1:
+        return speech(text)
+    speak_sentences(sentences)
+
+def speech_answer(chunks):
+    """Speak an answer that is still being generated, each sentence as soon as it is complete
+
+    Returns the text received, which stops early if the user barges in.
+    """
+    received = []
+    
+    def collect():
+        for chunk in chunks:
+            received.append(chunk)
+            yield chunk
+    
+    speak_sentences(stream_sentences(collect()))
+    return "".join(received).strip()
+
+def speak_sentences(sentences, render=synthesize):
+    """Queue each sentence for playback as soon as it is rendered"""
+    playbacks = []
+    spoken = []
+    
+    def render_sentence(sentence):
+        return sentence, render(sentence)
+    
+    def queue_sentence(rendered):
+        # Sentences are queued back to back for gapless playback; a barge-in drops the rest
+        if playbacks and playbacks[-1].interrupted:
+            return False
+        sentence, sound = rendered
+        spoken.append(spoken_text.add(sentence))  # heard from now on, not while it was synthesized
+        playbacks.append(play_sound(sound, block=False))
+        return True
+    
+    try:
+        # One-off answers are not cached; only the first sentence delays playback
+        play_sentences(sentences, render_sentence, queue_sentence, lookahead=TTS_LOOKAHEAD)
+        if playbacks:
+            playbacks[-1].wait()
+    except Exception as e:
+        print(f"Error with text-to-speech: {e}")
+    finally:
+        for ended in spoken:
+            ended()
+
+def fixed_texts():
+    """Every fixed prompt, greeting and command response; other speech is kept in memory only"""
+    return (
+        list(PROMPTS.values())
+        + [greeting_text(hour) for hour in GREETING_HOURS]
+        + list(COMMANDS.values())
+    )
+
+def warm_up(extra=()):
+    """Synthesize every fixed prompt, greeting and command response into the speech cache"""
+    texts = list(dict.fromkeys(fixed_texts() + list(extra)))
+    
+    def render(text):
+        try:
+            speech_cache.get_or_synthesize(text, 'en', tts_backend.voice, synthesize)
+            return True
+        except Exception as e:
+            print(f"Error pre-rendering '{text}': {e}")
+            return False
+    
+    started = time.time()
+    if HTTP_WARM_CONNECTIONS:
+        endpoints = []
+        if ASR_BACKEND != "whisper":
+            endpoints.append(STT_ENDPOINT)
+        if tts_backend.name == "gtts":
+            endpoints.append(TTS_ENDPOINT)
+        http_transport.warm_up(endpoints, HTTP_WARM_CONNECTIONS)
+    with ThreadPoolExecutor(max_workers=WARM_UP_WORKERS, thread_name_prefix="warm-up") as executor:
+        rendered = sum(executor.map(render, texts))
+    print(f"Warm-up: {rendered}/{len(texts)} prompts ready in {time.time() - started:.1f}s")
+    return rendered
+
+def wake_phrase_samples(audio):
+    """int16 samples of a wake phrase clip, cut to the span the VAD hears speech in"""
+    samples = np.frombuffer(audio.get_raw_data(convert_rate=SAMPLE_RATE, convert_width=2), dtype=np.int16)
+    if recognizer.segmenter is None:
+        return samples
+    span = recognizer.segmenter.detector.speech_span(samples.tobytes())
+    return samples if span is None else samples[span[0]:span[1]]
 
 def wake_word():
     """Listen for wake word with noise robustness"""
@@ -192,6 +701,17 @@ def wake_word():
     
     while True:
         try:
+            if spotter is not None and spotter.ready:
+                # Spot locally; nothing is sent to the cloud until the wake word is heard
+                detection = spotter.wait(timeout=2)
+                if detection is None:
+                    continue
+                
+                phrase, cost = detection
+                print(f"Wakeword detected locally: '{phrase}' (cost: {cost:.2f})")
+                speech(PROMPTS["listening"])
+                return
+            
             # Listen with shorter timeout for responsiveness
             audio = recognizer.listen_with_noise_filtering(timeout=2, phrase_time_limit=4)
             
@@ -200,12 +720,15 @@ def wake_word():
                 
             # Recognize with confidence
             query, confidence = recognizer.recognize_with_confidence(audio)
+            if FULL_DUPLEX:  # with the microphone muted during playback nothing of it can be heard
+                query = spoken_text.strip(query, *audio.captured) or None
             
             if query is None:
                 consecutive_failures += 1
                 if consecutive_failures >= max_failures:
-                    print("Recalibrating microphone due to poor recognition...")
-                    recognizer.setup_microphone()
+                    if recognizer.noise_tracker is None:
+                        print("Recalibrating microphone due to poor recognition...")
+                        recognizer.setup_microphone()
                     consecutive_failures = 0
                 continue
             
@@ -217,7 +740,10 @@ def wake_word():
                 if word in query or any(w in query for w in word.split()):
                     if confidence > 0.4 or word in query:  # Lower threshold for exact matches
                         print("Wakeword detected!")
-                        speech(f"I'm Listening {USER}. Say your command and then say 'finished eva' when finished.")
+                        # Only a clip of the wake phrase alone makes a template, trimmed to its speech
+                        if spotter is not None and WAKEWORD_AUTO_ENROLL and query.strip() == word and not spotter.ready:
+                            spotter.enroll(word, [wake_phrase_samples(audio)])
+                        speech(PROMPTS["listening"])
                         return
                         
         except sr.WaitTimeoutError:
@@ -227,20 +753,23 @@ def wake_word():
             time.sleep(0.5)
             continue
 
-def greetings():
-    """Generate and speak greeting"""
-    hour = datetime.now().hour
-    
+def greeting_text(hour):
+    """Greeting spoken at startup for the given hour of the day"""
     if 6 <= hour < 12:
         greet = f"Good morning {USER}"
     elif 12 <= hour <= 16:
-        greet = f"Good afternoon {USER}"    
+        greet = f"Good afternoon {USER}"
     elif 16 <= hour < 19:
-        greet = f"Good evening {USER}"    
+        greet = f"Good evening {USER}"
     else:
-        greet = f"Hello {USER}"    
+        greet = f"Hello {USER}"
     
     greet += f". I am {HOSTNAME}. Say Hey Eva to activate me. Give me your command and say 'finished eva' when finished. You can also say 'cancel' to start over. When you are done say bye eva to deactivate."
+    return greet
+
+def greetings():
+    """Generate and speak greeting"""
+    greet = greeting_text(datetime.now().hour)
     
     speech(greet)
     print(greet)
@@ -295,17 +824,28 @@ def get_command_preview(command_parts):
     return preview
 
 def listen():
+    pipeline = None
     try:
         print("Listening for command... (Say 'finished eva' when you finish your command)")
         
         full_command = ""
         command_parts = []
         silence_count = 0
+        if prefetch is not None:
+            prefetch.discard()
         max_silence = 3  # Allow 3 periods of silence before prompting
         
+        pipeline = SegmentPipeline(
+            lambda: recognizer.listen_for_segment(timeout=15, phrase_time_limit=10),
+            lambda audio: recognizer.recognize_with_confidence(audio, language='en-IN'),
+            workers=RECOGNITION_WORKERS if PIPELINED_LISTEN else 0,
+            interrupt=recognizer.interrupt_listening
+        ).start()
+        
         while True:
-            # Listen for a segment of the command
-            audio = recognizer.listen_for_segment(timeout=15, phrase_time_limit=10)
+            # Next segment in spoken order; capture keeps running while earlier ones are transcribed
+            # and while short prompts play, so the user can talk over them
+            audio, segment, confidence = pipeline.next()
             
             if audio is None:
                 silence_count += 1
@@ -313,34 +853,40 @@ def listen():
                     if silence_count >= max_silence:
                         # Long silence with partial command - offer options
                         preview = get_command_preview(command_parts)
-                        speech(f"I have: {preview}. Say 'finished eva' to process, 'cancel' to start over, or continue your command.")
+                        speech(f"I have: {preview}. Say 'finished eva' to process, 'cancel' to start over, or continue your command.", block=False)
                         silence_count = 0
                         continue
                     else:
                         # Short silence - gentle prompt
-                        speech("I'm still listening. Continue or say 'finished eva'.")
+                        speech(PROMPTS["still_listening"], block=False)
                         continue
                 else:
                     # No command started yet, timeout
-                    speech("I didn't hear anything. Please try again.")
+                    speech(PROMPTS["nothing_heard"])
                     return None
             
             silence_count = 0  # Reset silence counter on successful audio
-            segment, confidence = recognizer.recognize_with_confidence(audio, language='en-IN')
+            
+            # Echo of a prompt that played over the capture, such as its "say 'finished eva'", is not the user
+            if segment is not None and FULL_DUPLEX:
+                segment = spoken_text.strip(segment, *audio.captured)
+                if not segment:
+                    print("Ignored a segment that only repeated the assistant's own words")
+                    continue
             
             if segment is None:
                 if command_parts:
-                    speech("I didn't catch that part. Please continue or say 'done'.")
+                    speech(PROMPTS["missed_part"], block=False)
                     continue
                 else:
-                    speech("I couldn't hear you clearly. Please try again.")
+                    speech(PROMPTS["unclear"])
                     return None
             
             print(f"Heard segment: '{segment}' (confidence: {confidence:.2f})")
             
             # Check for cancel command
             if check_cancel_word(segment):
-                speech("Command cancelled. Give me a new command.")
+                speech(PROMPTS["cancelled"])
                 return None
             
             # Check if this segment contains "done"
@@ -353,18 +899,18 @@ def listen():
                     # Confirm before processing long commands
                     if len(full_command) > 100:
                         preview = get_command_preview(command_parts)
-                        speech(f"Processing: {preview}")
+                        speech(f"Processing: {preview}", block=False)
                     
                     break
                 else:
                     # User said "done" without giving a command
-                    speech("You didn't give me a command. Please try again.")
+                    speech(PROMPTS["no_command"])
                     return None
             
             # Check for exit commands in this segment
             exit_words = ['leave', 'exit', 'quit', 'goodbye']
             if any(word in segment for word in exit_words):
-                farewell = f'Good bye {USER}, have an amazing day!'
+                farewell = PROMPTS["farewell"]
                 speech(farewell)
                 print(farewell)
                 return farewell
@@ -372,27 +918,44 @@ def listen():
             # Add this segment to the command parts
             command_parts.append(segment)
             
+            # Answer what has been said so far while the user carries on or signs off
+            partial_command = " ".join(command_parts)
+            if prefetch is not None and predefined_response(partial_command.lower()) is None:
+                prefetch.speculate(partial_command)
+            
             # Give contextual feedback
             if len(command_parts) == 1:
-                speech("Got it. Continue or say 'done'.")
+                speech(PROMPTS["got_it"], block=False)
             elif len(command_parts) % 3 == 0:  # Every 3rd segment
-                speech("Still listening...")
+                speech(PROMPTS["still_listening_short"], block=False)
             else:
                 # Just print to console to avoid too much audio feedback
                 print("Continuing to listen...")
         
+        pipeline.stop()
+        
         # Process the complete command
         if full_command:
             response = process_command(full_command)
             return response
         else:
-            speech("I didn't receive a complete command. Please try again.")
+            speech(PROMPTS["incomplete"])
             return None
     
     except Exception as e:
         print(f"Error in listen(): {e}")
-        speech("Sorry, I had trouble hearing you. Let's try again.")
+        speech(PROMPTS["listen_error"])
         return None
+    finally:
+        if pipeline is not None:
+            pipeline.stop()
+
+def predefined_response(query):
+    """Response of the first predefined command the query mentions, or None"""
+    for key in COMMANDS:
+        if key in query or any(word in query for word in key.split()):
+            return COMMANDS[key]
+    return None
 
 def process_command(query):
     
@@ -405,19 +968,40 @@ def process_command(query):
     print(f"[{timestamp}] User command: {query}")
     
     # Check predefined commands first (with partial matching)
-    for key in COMMANDS:
-        if key in query or any(word in query for word in key.split()):
-            response = COMMANDS[key]
-            speech(response)
-            print(f"Response: {response}")
-            return response
+    response = predefined_response(query)
+    if response is not None:
+        speech(response)
+        print(f"Response: {response}")
+        return response
+    
+    # Questions asked before are answered from the response cache, their speech cached too
+    response = response_cache.get(query, 'en') if response_cache is not None else None
+    if response is not None:
+        speak_sentences(split_sentences(response), render=synthesize_cached)
+        print(f"Cached AI Response: {response}")
+        return response
+    
+    # The answer to this exact command may have been fetched while it was being dictated
+    response = prefetch.take(query) if prefetch is not None else None
+    if response is not None and response != PROMPTS["vertex_error"]:
+        if response_cache is not None:
+            response_cache.put(query, 'en', response)
+        speech_streamed(response)
+        print(f"Speculative AI Response: {response}")
+        return response
     
     # Show processing indicator for longer commands
     if len(query) > 50:
-        speech("Processing your request...")
+        speech(PROMPTS["processing"], block=False)
     
-    response = vertex(query)
-    speech(response)
+    if STREAM_VERTEX:
+        response = speech_answer(vertex_stream(query))
+    else:
+        response = vertex(query)
+        if STREAM_SPEECH:
+            speech_streamed(response)
+        else:
+            speech(response)
     print(f"AI Response: {response}")
     return response   
 
@@ -0,0 +1,134 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+import speech_recognition as sr
+from speech_recognition.recognizers.google import OutputParser, create_request_builder
+
+GOOGLE_STT_ENDPOINT = "http://www.google.com/speech-api/v2/recognize"
+GOOGLE_TTS_ENDPOINT = "https://translate.google.com/_/TranslateWebserverUi/data/batchexecute"
+
+
+class HttpTransport:
+    """One requests session whose keep-alive connections all cloud calls share
+
+    Each host gets a pool of up to ``pool_maxsize`` open connections, so
+    back-to-back recognition and synthesis requests skip the TCP and TLS
+    handshakes. ``warm_up()`` opens them before the first turn. Only
+    connection failures are retried; a request that reached the server is
+    never sent twice.
+    """
+
+    def __init__(self, pool_connections=4, pool_maxsize=8, max_retries=1, timeout=10):
+        self.timeout = timeout  # seconds, when the caller gives none
+        self.session = requests.Session()
+        self.adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                                   max_retries=max_retries)
+        self.session.mount("http://", self.adapter)
+        self.session.mount("https://", self.adapter)
+        self.lock = threading.Lock()
+
+        self.requests = 0
+        self.failures = 0
+        self.warmed = 0
+
+    def request(self, method, url, timeout=None, **kwargs):
+        with self.lock:
+            self.requests += 1
+        try:
+            return self.session.request(method, url, timeout=timeout or self.timeout, **kwargs)
+        except requests.RequestException:
+            with self.lock:
+                self.failures += 1
+            raise
+
+    def post(self, url, data=None, headers=None, timeout=None):
+        return self.request("POST", url, data=data, headers=headers, timeout=timeout)
+
+    def warm_up(self, urls, connections=2, timeout=5):
+        """Open ``connections`` keep-alive connections to the host of each URL; returns how many opened
+
+        The HEAD requests are sent concurrently, and each keeps its connection
+        checked out until all of them have answered, so none can ride on
+        another's connection. Any answer, even an error status, leaves its
+        connection in the pool.
+        """
+        origins = list(dict.fromkeys(f"{parts.scheme}://{parts.netloc}/" for parts in map(urlsplit, urls)))
+        if not origins:
+            return 0
+
+        targets = [origin for origin in origins for _ in range(connections)]
+        answered = threading.Barrier(len(targets))
+
+        def touch(origin):
+            response = None
+            try:
+                response = self.request("HEAD", origin, timeout=timeout, allow_redirects=False, stream=True)
+                return True
+            except Exception as e:
+                print(f"Error warming up connection to {origin}: {e}")
+                return False
+            finally:
+                try:
+                    answered.wait(timeout)
+                except threading.BrokenBarrierError:
+                    pass
+                if response is not None:
+                    response.content  # reading the empty body hands the connection back to the pool
+                    response.close()
+
+        with ThreadPoolExecutor(max_workers=len(targets), thread_name_prefix="http-warm-up") as executor:
+            opened = sum(executor.map(touch, targets))
+        with self.lock:
+            self.warmed += opened
+        return opened
+
+    def connections(self):
+        """Connections opened so far, per host"""
+        pools = self.adapter.poolmanager.pools
+        opened = {}
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                opened[f"{pool.scheme}://{pool.host}:{pool.port}"] = pool.num_connections
+        return opened
+
+    def stats(self):
+        opened = sum(self.connections().values())
+        with self.lock:
+            reused = max(0, self.requests - opened)
+            return {
+                "requests": self.requests,
+                "failures": self.failures,
+                "connections": opened,
+                "warmed": self.warmed,
+                "reused": reused,
+                "reuse_rate": reused / float(self.requests) if self.requests else 0.0,
+            }
+
+    def close(self):
+        self.session.close()
+
+
+def recognize_google(transport, audio, language="en-US", show_all=False, endpoint=GOOGLE_STT_ENDPOINT, key=None,
+                     timeout=None):
+    """Recognizer.recognize_google over a pooled connection
+
+    Sends the same request and parses the answer the same way, raising
+    sr.UnknownValueError and sr.RequestError like the original.
+    """
+    builder = create_request_builder(endpoint=endpoint, key=key, language=language)
+    try:
+        response = transport.post(
+            builder.build_url(),
+            data=builder.build_data(audio),
+            headers=builder.build_headers(audio),
+            timeout=timeout
+        )
+        response.raise_for_status()
+    except requests.HTTPError as e:
+        raise sr.RequestError(f"recognition request failed: {e.response.reason}")
+    except requests.RequestException as e:
+        raise sr.RequestError(f"recognition connection failed: {e}")
+    return OutputParser(show_all=show_all, with_confidence=False).parse(response.content.decode("utf-8"))
@@ -5,9 +5,24 @@ from english import (
     wake_word, 
     listen, 
     speech, 
-    check_stop_words
+    check_stop_words,
+    speech_cache,
+    response_cache,
+    prefetch,
+    guards,
+    tts_backend,
+    http_transport,
+    warm_up
 )
 
+# Prompts spoken by the main loop, pre-rendered alongside english.PROMPTS
+PROMPTS = {
+    "sleep": "Naenda kulala. Sema Hujambo Eva kuniamsha.",  # "Going back to sleep. Say Hello Eva to wake me up."
+    "standby": "Sawa. Sema tu Hujambo Eva ukihitaji msaada.",  # "Okay. Just say Hello Eva when you need me again."
+    "goodbye": "Kwaheri!",  # "Goodbye!"
+    "restart": "Nina tatizo. Tafadhali nianzishe upya.",  # "I'm having some trouble. Please restart me."
+}
+
 def main():
     print("=== Eva Voice Assistant Starting ===")
     print("New flow: Say 'Hujambo Eva' -> Give command -> Say 'nimemaliza eva' to finish")
@@ -19,6 +34,8 @@ def main():
     except:
         print("Microphone test failed - restart execution please !")
     
+    warm_up(PROMPTS.values())
+    
     greetings()
     
     try:
@@ -38,14 +55,14 @@ def main():
                 if command is None:
                     command_timeout += 1
                     if command_timeout >= max_command_timeout:
-                        speech("Naenda kulala. Sema Hujambo Eva kuniamsha.")  # "Going back to sleep. Say Hello Eva to wake me up."
+                        speech(PROMPTS["sleep"])
                         break
                     continue
                 
                 command_timeout = 0  # Reset timeout on successful command
                 
                 if check_stop_words(command):
-                    speech("Sawa. Sema tu Hujambo Eva ukihitaji msaada.")  # "Okay. Just say Hello Eva when you need me again."
+                    speech(PROMPTS["standby"])
                     break
                 
                 # Check for exit commands
@@ -56,10 +73,25 @@ def main():
     
     except KeyboardInterrupt:
         print("\nProgram interrupted by user")
-        speech("Kwaheri!")  # "Goodbye!"
+        speech(PROMPTS["goodbye"])
     except Exception as e:
         print(f"Unexpected error: {e}")
-        speech("Nina tatizo. Tafadhali nianzishe upya.")  # "I'm having some trouble. Please restart me."
+        speech(PROMPTS["restart"])
+    finally:
+        if recognizer.locale_stats is not None:
+            print(f"Locale stats: {recognizer.locale_stats.summary()}")
+        if recognizer.echo_canceller is not None:
+            print(f"Echo canceller: {recognizer.echo_canceller.stats()}")
+        print(f"Speech cache: {speech_cache.stats()}")
+        if response_cache is not None:
+            print(f"Response cache: {response_cache.stats()}")
+        if prefetch is not None:
+            print(f"Speculative prefetch: {prefetch.stats()}")
+        for guard in guards:
+            print(f"Circuit {guard.name}: {guard.stats()}")
+        if tts_backend.stats():
+            print(f"Speech engine: {tts_backend.stats()}")
+        print(f"HTTP connections: {http_transport.stats()}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
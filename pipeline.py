@@ -0,0 +1,111 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class SegmentPipeline:
+    """Keeps capturing command segments while earlier ones are transcribed
+
+    A capture thread calls ``capture()`` back to back and hands every segment to
+    a pool of ``workers`` running ``recognize(audio)``. ``next()`` returns
+    (audio, transcript, confidence) in capture order regardless of which
+    transcription finishes first; audio is None when a capture timed out.
+    With ``workers=0`` nothing runs in the background and ``next()`` captures
+    and recognizes inline, like the original listen loop.
+    """
+
+    MIN_CAPTURE_INTERVAL = 0.5  # seconds; stops a failing capture from spinning
+
+    def __init__(self, capture, recognize, workers=2, interrupt=None):
+        self.capture = capture
+        self.recognize = recognize
+        self.workers = workers
+        self.interrupt = interrupt  # callable that makes a capture in progress return early
+        self.executor = None
+        self.thread = None
+        self.running = False
+        self.results = {}
+        self.captured = 0
+        self.delivered = 0
+        self.condition = threading.Condition()
+
+    def start(self):
+        if self.workers <= 0:
+            return self
+        self.running = True
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="segment-recognition")
+        self.thread = threading.Thread(target=self._capture_loop, name="segment-capture", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop capturing and drop segments not yet returned by ``next()``"""
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.thread is not None:
+            # A capture that opened its source just after an interrupt misses it, so keep
+            # interrupting until the thread is gone and no longer holds the microphone
+            while self.thread.is_alive():
+                if self.interrupt is None:
+                    self.thread.join()
+                    break
+                self.interrupt()
+                self.thread.join(timeout=0.1)
+        elif self.interrupt is not None:
+            self.interrupt()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def _capture_loop(self):
+        while self.running:
+            started = time.monotonic()
+            audio = self.capture()
+            if not self.running:
+                break
+
+            sequence = self.captured
+            self.captured += 1
+            if audio is None:
+                self._deliver(sequence, (None, None, 0))
+                time.sleep(max(0, self.MIN_CAPTURE_INTERVAL - (time.monotonic() - started)))
+            else:
+                self.executor.submit(self._recognize, sequence, audio)
+
+    def _recognize(self, sequence, audio):
+        try:
+            transcript, confidence = self.recognize(audio)
+        except Exception as e:
+            print(f"Error recognizing segment: {e}")
+            transcript, confidence = None, 0
+        self._deliver(sequence, (audio, transcript, confidence))
+
+    def _deliver(self, sequence, result):
+        with self.condition:
+            self.results[sequence] = result
+            self.condition.notify_all()
+
+    def next(self, timeout=None):
+        """Next segment in capture order as (audio, transcript, confidence); (None, None, 0) if stopped or timed out"""
+        if self.workers <= 0:
+            audio = self.capture()
+            if audio is None:
+                return None, None, 0
+            transcript, confidence = self.recognize(audio)
+            return audio, transcript, confidence
+
+        with self.condition:
+            ready = self.condition.wait_for(
+                lambda: self.delivered in self.results or not self.running, timeout
+            )
+            if not ready or self.delivered not in self.results:
+                return None, None, 0
+            result = self.results.pop(self.delivered)
+            self.delivered += 1
+            return result
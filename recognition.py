@@ -0,0 +1,324 @@
+import collections
+import json
+import os
+import re
+import threading
+import time
+import concurrent.futures
+import numpy as np
+import speech_recognition as sr
+
+
+class Utterance(sr.AudioData):
+    """Captured phrase that compresses itself once for all recognition attempts
+
+    ``recognize_google`` calls ``get_flac_data`` for every locale and for the
+    fallback request; the first call runs the FLAC encoder and the others,
+    including concurrent ones, reuse its output.
+    """
+
+    def __init__(self, frame_data, sample_rate, sample_width):
+        super().__init__(frame_data, sample_rate, sample_width)
+        self.encoded = {}
+        self.lock = threading.Lock()
+
+    def get_flac_data(self, convert_rate=None, convert_width=None):
+        key = ("flac", convert_rate, convert_width)
+        with self.lock:
+            if key not in self.encoded:
+                self.encoded[key] = super().get_flac_data(convert_rate, convert_width)
+            return self.encoded[key]
+
+
+def prepare_utterance(audio, energy_threshold, frame_duration=0.02, margin=0.2, ratio=0.5):
+    """Trim silence from both ends of ``audio`` and wrap it as an Utterance
+
+    Frames quieter than ``ratio * energy_threshold`` at either end are dropped,
+    keeping ``margin`` seconds of context so word onsets survive. Audio without
+    any frame above the bar is only wrapped, never emptied.
+    """
+    if isinstance(audio, Utterance):
+        return audio
+
+    frame_data = audio.frame_data
+    if audio.sample_width == 2:
+        samples = np.frombuffer(frame_data, dtype=np.int16).astype(np.float32)
+        frame_size = max(1, int(audio.sample_rate * frame_duration))
+        count = len(samples) // frame_size
+        frames = samples[:count * frame_size].reshape(count, frame_size)
+        loud = np.flatnonzero(np.sqrt(np.mean(frames * frames, axis=1)) > energy_threshold * ratio)
+        if len(loud):
+            pad = int(margin / frame_duration)
+            start = max(loud[0] - pad, 0) * frame_size
+            end = min((loud[-1] + 1 + pad) * frame_size, len(samples))
+            frame_data = frame_data[start * 2:end * 2]
+
+    return Utterance(frame_data, audio.sample_rate, audio.sample_width)
+
+
+def unique(languages):
+    """Drop repeated locales while keeping their priority order"""
+    seen = set()
+    return [lang for lang in languages if not (lang in seen or seen.add(lang))]
+
+
+def best_alternative(result, threshold=0.3):
+    """Pick (transcript, confidence, confident) from a ``show_all`` Google result, or None"""
+    if not result or not isinstance(result, dict) or 'alternative' not in result:
+        return None
+
+    alternatives = result['alternative']
+    if not alternatives:
+        return None
+
+    best_result = alternatives[0]
+    confidence = best_result.get('confidence', 0)
+    transcript = best_result.get('transcript', '')
+    return transcript.lower(), confidence, confidence > threshold or len(alternatives) == 1
+
+
+def fallback_alternative(result):
+    """Transcript the non-``show_all`` API call would have returned for the same response"""
+    if not result or not isinstance(result, dict) or not result.get('alternative'):
+        return None
+    alternatives = result['alternative']
+    scored = [alt for alt in alternatives if 'confidence' in alt]
+    best = scored[0] if scored else alternatives[0]
+    return best['transcript'].lower()
+
+
+def recognize_concurrently(recognize, languages, executor, deadline=None, threshold=0.3, scored=None):
+    """Query every locale at once and keep the first confident answer
+
+    ``recognize(lang)`` returns a ``show_all`` result. Slower locales are
+    cancelled if still queued and otherwise ignored. When no locale is
+    confident, the primary locale's own response stands in for the old extra
+    fallback request. Returns (transcript, confidence, locale), with a None
+    transcript when nothing was recognized.
+
+    Once every request has finished or been cancelled, ``scored(attempted,
+    confidences)`` is called with the locales that were actually sent and
+    the confidence of each one that recognized something, in priority
+    order. This includes answers that arrived after the result was
+    returned.
+    """
+    languages = unique(languages)
+    futures = {executor.submit(recognize, lang): lang for lang in languages}
+    if scored is not None:
+        score_when_finished(futures, languages, scored)
+    started = time.monotonic()
+    results = {}
+    errors = []
+    pending = set(futures)
+
+    try:
+        while pending:
+            remaining = None if deadline is None else deadline - (time.monotonic() - started)
+            if remaining is not None and remaining <= 0:
+                break
+            done, pending = concurrent.futures.wait(
+                pending, timeout=remaining, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                lang = futures[future]
+                try:
+                    results[lang] = future.result()
+                except sr.UnknownValueError:
+                    results[lang] = None
+                except Exception as e:
+                    errors.append(e)
+                    continue
+
+                best = best_alternative(results[lang], threshold)
+                if best and best[2]:
+                    return best[0], best[1], lang
+    finally:
+        for future in pending:
+            future.cancel()
+
+    transcript = fallback_alternative(results.get(languages[0]))
+    if transcript:
+        return transcript, 0.8, languages[0]
+    if errors and not results:
+        raise sr.RequestError(f"all locale requests failed: {errors[0]}")
+    return None, 0, None
+
+
+def score_when_finished(futures, languages, scored):
+    lock = threading.Lock()
+    attempted = set()
+    confidences = {}
+    remaining = [len(futures)]
+
+    def finished(future):
+        lang = futures[future]
+        best = None
+        if not future.cancelled():
+            try:
+                best = best_alternative(future.result())
+            except Exception:
+                pass
+        with lock:
+            if not future.cancelled():
+                attempted.add(lang)
+            if best:
+                confidences[lang] = best[1]
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        scored([lang for lang in languages if lang in attempted],
+               {lang: confidences[lang] for lang in languages if lang in confidences})
+
+    for future in futures:
+        future.add_done_callback(finished)
+
+
+class LocaleStats:
+    """Which locales recognize a speaker, tracked per session and persisted to disk
+
+    The requested locale always stays first. Its variants are reordered by
+    smoothed win rate, and variants that keep failing are pruned, so most
+    utterances are recognized on the first call. A win goes to the locale
+    that recognized the utterance most confidently, not to the one that
+    answered first.
+    Both session and lifetime counters record how many STT calls were made
+    against an estimate of what the fixed order would have needed.
+    """
+
+    def __init__(self, path, speaker, min_attempts=5, prune_rate=0.1, explore_every=20):
+        self.path = path
+        self.speaker = speaker or "default"
+        self.min_attempts = min_attempts
+        self.prune_rate = prune_rate
+        self.explore_every = explore_every  # pruned locales get another chance this often
+        self.lock = threading.Lock()
+        self.data = self.load()
+        self.totals = self.data.setdefault(self.speaker, self.empty())
+        self.session = self.empty()
+
+    @staticmethod
+    def empty():
+        return {"locales": {}, "utterances": 0, "calls": 0, "baseline_calls": 0}
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"Error loading locale stats: {e}")
+            return {}
+
+    def save(self):
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self.data, f, indent=2)
+        os.replace(temp_path, self.path)
+
+    def win_rate(self, lang):
+        stats = self.totals["locales"].get(lang, {})
+        return (stats.get("wins", 0) + 1.0) / (stats.get("attempts", 0) + 2.0)
+
+    def order(self, languages):
+        """The requested locale, then its variants by win rate without those that practically never win"""
+        languages = unique(languages)
+        requested, variants = languages[:1], languages[1:]
+        with self.lock:
+            ranked = sorted(variants, key=self.win_rate, reverse=True)
+            if self.totals["utterances"] % self.explore_every == 0:
+                return requested + ranked
+            kept = [
+                lang for lang in ranked
+                if self.totals["locales"].get(lang, {}).get("attempts", 0) < self.min_attempts
+                or self.win_rate(lang) >= self.prune_rate
+            ]
+        return requested + kept
+
+    def record(self, attempted, winner, confidence, baseline_calls):
+        """Count one utterance: locales called, the one that won (or None) and the fixed-order cost"""
+        with self.lock:
+            for stats in (self.session, self.totals):
+                stats["utterances"] += 1
+                stats["calls"] += len(attempted)
+                stats["baseline_calls"] += baseline_calls
+                for lang in attempted:
+                    locale = stats["locales"].setdefault(lang, {"attempts": 0, "wins": 0, "confidence": 0.0})
+                    locale["attempts"] += 1
+                    if lang == winner:
+                        locale["wins"] += 1
+                        locale["confidence"] += confidence
+            try:
+                self.save()
+            except Exception as e:
+                print(f"Error saving locale stats: {e}")
+
+    def summary(self, stats=None):
+        """One-line report of calls per utterance and calls saved"""
+        stats = stats or self.session
+        utterances = max(stats["utterances"], 1)
+        wins = {
+            lang: locale["wins"] for lang, locale in stats["locales"].items() if locale["wins"]
+        }
+        return (
+            f"{stats['utterances']} utterances, {stats['calls'] / utterances:.2f} STT calls each "
+            f"(fixed order: {stats['baseline_calls'] / utterances:.2f}), "
+            f"{stats['baseline_calls'] - stats['calls']} calls saved, wins by locale: {wins}"
+        )
+
+
+def words(text):
+    """Lowercase words of ``text`` without punctuation or quotes"""
+    return [word.strip("'") for word in re.findall(r"[\w']+", text.lower()) if word.strip("'")]
+
+
+class SpokenText:
+    """What the assistant said and when, so its own words are not taken for the user's
+
+    While the microphone stays open during playback, echo the canceller
+    leaves behind can be transcribed, and a prompt like "continue or say
+    'finished eva'" would end the command it was meant to extend. ``strip``
+    removes from a transcript every run of ``min_words`` or more words that
+    also occurs in something played while the audio was being captured,
+    plus ``hold`` seconds of room echo and device latency. Record speech with
+    ``add`` when it goes to the output, not while it is still synthesizing,
+    so an answer given right after a prompt is not mistaken for its echo.
+    """
+
+    def __init__(self, hold=0.25, min_words=2, keep=16):
+        self.hold = hold
+        self.min_words = min_words
+        self.spoken = collections.deque(maxlen=keep)  # [words, started, ended or None while playing]
+        self.lock = threading.Lock()
+
+    def add(self, text):
+        """Record that ``text`` starts playing now; returns the callback to attach to its Playback"""
+        entry = [words(text), time.time(), None]
+        with self.lock:
+            self.spoken.append(entry)
+
+        def ended(playback=None):
+            entry[2] = time.time()
+        return ended
+
+    def strip(self, transcript, started, ended):
+        """``transcript`` of audio captured from ``started`` to ``ended`` without the assistant's words"""
+        if not transcript:
+            return transcript
+        tokens = transcript.split()
+        heard = [" ".join(words(token)) for token in tokens]
+        with self.lock:
+            overlapping = [
+                said for said, began, finished in self.spoken
+                if began <= ended and (finished is None or finished + self.hold >= started)
+            ]
+        echoed = [False] * len(tokens)
+        for said in overlapping:
+            for i in range(len(heard)):
+                for k in range(len(said)):
+                    length = 0
+                    while i + length < len(heard) and k + length < len(said) and heard[i + length] == said[k + length]:
+                        length += 1
+                    if length >= self.min_words:
+                        echoed[i:i + length] = [True] * length
+        return " ".join(token for token, echo in zip(tokens, echoed) if not echo)
@@ -0,0 +1,282 @@
+import collections
+import concurrent.futures
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+
+class CircuitOpenError(Exception):
+    """The service's circuit is open; the call was not attempted"""
+
+
+class DeadlineExceeded(Exception):
+    """The service did not answer within the call's deadline"""
+
+
+class CircuitBreaker:
+    """Stops calling a service that keeps failing or answering too slowly
+
+    Over the last ``window`` calls, once at least ``min_calls`` have been
+    made, a share of bad calls (errors, or answers slower than
+    ``latency_budget`` seconds) reaching ``error_rate`` opens the circuit.
+    After ``cooldown`` seconds one trial call is let through (half open); its
+    outcome closes the circuit again or re-opens it.
+    """
+
+    def __init__(self, error_rate=0.5, latency_budget=None, window=20, min_calls=5, cooldown=30.0):
+        self.error_rate = error_rate
+        self.latency_budget = latency_budget
+        self.min_calls = min_calls
+        self.cooldown = cooldown
+        self.outcomes = collections.deque(maxlen=window)  # True for each bad call
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.probing = False
+        self.trips = 0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """Whether a call may go out now"""
+        with self.lock:
+            if self.state == "open":
+                if time.monotonic() - self.opened_at < self.cooldown:
+                    return False
+                self.state = "half_open"
+                self.probing = False
+            if self.state == "half_open":
+                if self.probing:
+                    return False
+                self.probing = True
+            return True
+
+    def record(self, ok, latency=0.0):
+        bad = not ok or (self.latency_budget is not None and latency > self.latency_budget)
+        with self.lock:
+            if self.state == "half_open":
+                if bad:
+                    self._trip()
+                else:
+                    self.state = "closed"
+                    self.outcomes.clear()
+                return
+            self.outcomes.append(bad)
+            if len(self.outcomes) >= self.min_calls and sum(self.outcomes) >= self.error_rate * len(self.outcomes):
+                self._trip()
+
+    def _trip(self):
+        self.state = "open"
+        self.opened_at = time.monotonic()
+        self.outcomes.clear()
+        self.trips += 1
+
+    @property
+    def open(self):
+        with self.lock:
+            return self.state == "open" and time.monotonic() - self.opened_at < self.cooldown
+
+
+class Guard:
+    """Deadline, hedging and circuit breaking around one outbound service
+
+    ``call()`` runs the request on a worker thread and gives up after
+    ``deadline`` seconds; the abandoned request finishes in the background.
+    With ``hedge_percentile`` set, an idempotent request still unanswered
+    after that percentile of recent latencies is sent a second time and the
+    first answer wins. Errors and timeouts feed ``breaker``, and while it is
+    open calls fail at once with CircuitOpenError so callers can switch to a
+    local engine instead of waiting.
+
+    Deadlines and latencies are measured from when a worker starts the
+    request, so time spent queued behind other calls is not blamed on the
+    service. A request that waits a whole deadline without getting a worker
+    (every one of them stuck on the service) fails with DeadlineExceeded and
+    counts against the service too. Hedges run on a pool of their own and
+    never queue behind the requests they are meant to overtake.
+    """
+
+    def __init__(self, name, deadline=None, hedge_percentile=None, breaker=None, max_workers=8, window=100,
+                 min_samples=10):
+        self.name = name
+        self.deadline = deadline
+        self.hedge_percentile = hedge_percentile
+        self.breaker = breaker or CircuitBreaker()
+        self.min_samples = min_samples
+        self.latencies = collections.deque(maxlen=window)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"guard-{name}")
+        self.hedge_executor = None
+        if hedge_percentile is not None:
+            self.hedge_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"guard-{name}-hedge")
+        self.lock = threading.Lock()
+        self.was_open = False
+
+        self.calls = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def hedge_delay(self):
+        """Seconds to wait before a duplicate request, or None while hedging is off or unlearned"""
+        with self.lock:
+            if self.hedge_percentile is None or len(self.latencies) < self.min_samples:
+                return None
+            return float(np.percentile(self.latencies, self.hedge_percentile))
+
+    def admit(self):
+        if not self.breaker.allow():
+            with self.lock:
+                self.rejected += 1
+            raise CircuitOpenError(f"{self.name} is unavailable, circuit open")
+        with self.lock:
+            self.calls += 1
+
+    def record(self, ok, latency, timed_out=False):
+        with self.lock:
+            if ok:
+                self.latencies.append(latency)
+            else:
+                self.failures += 1
+                self.timeouts += int(timed_out)
+        self.breaker.record(ok, latency)
+        opened = self.breaker.state == "open"
+        if opened != self.was_open:
+            self.was_open = opened
+            print(f"{self.name} circuit {'opened' if opened else 'closed'}")
+
+    @staticmethod
+    def attempt(running, fn, args, kwargs):
+        running.set()
+        return fn(*args, **kwargs)
+
+    def wait_for_worker(self, running, future):
+        """Wait up to the deadline for a worker to start ``future``, which sets ``running``"""
+        if running.wait(self.deadline) or not future.cancel():
+            running.wait()  # a worker took it just as the deadline ran out
+            return
+        self.record(False, self.deadline, timed_out=True)
+        raise DeadlineExceeded(f"{self.name} had no free worker within {self.deadline}s")
+
+    def call(self, fn, *args, ignore=(), **kwargs):
+        """Return ``fn(*args, **kwargs)`` within the deadline
+
+        Exceptions in ``ignore`` are answers rather than failures (e.g. "no
+        speech recognized") and are re-raised without counting against the
+        service.
+        """
+        self.admit()
+        running = threading.Event()
+        future = self.executor.submit(self.attempt, running, fn, args, kwargs)
+        self.wait_for_worker(running, future)  # the clock starts with the request, not while it waits for a worker
+        pending = {future: False}  # future -> is the hedge
+        started = time.monotonic()
+        delay = self.hedge_delay()
+        errors = []
+        while pending:
+            elapsed = time.monotonic() - started
+            timeouts = []
+            if self.deadline is not None:
+                timeouts.append(self.deadline - elapsed)
+            if delay is not None and len(pending) == 1 and not any(pending.values()):
+                timeouts.append(delay - elapsed)
+            timeout = max(0.0, min(timeouts)) if timeouts else None
+
+            done, _ = concurrent.futures.wait(pending, timeout=timeout, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                hedge = pending.pop(future)
+                try:
+                    result = future.result()
+                except ignore:
+                    self.record(True, time.monotonic() - started)
+                    raise
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                self.record(True, time.monotonic() - started)
+                if hedge:
+                    with self.lock:
+                        self.hedge_wins += 1
+                return result
+
+            elapsed = time.monotonic() - started
+            if self.deadline is not None and elapsed >= self.deadline:
+                break
+            if not done and delay is not None and elapsed >= delay and not any(pending.values()):
+                with self.lock:
+                    self.hedges += 1
+                pending[self.hedge_executor.submit(fn, *args, **kwargs)] = True
+                delay = None
+
+        if pending or not errors:
+            self.record(False, time.monotonic() - started, timed_out=True)
+            raise DeadlineExceeded(f"{self.name} did not answer within {self.deadline}s")
+        self.record(False, time.monotonic() - started)
+        raise errors[0]
+
+    def stream(self, fn, *args, **kwargs):
+        """Yield the items of the iterable ``fn(*args, **kwargs)``, each within the deadline
+
+        The call counts as answered, for the breaker and the percentiles, once
+        its first item arrives; stalls and errors before that count against
+        the service.
+        """
+        self.admit()
+        items = queue.Queue()
+        running = threading.Event()
+        stopped = threading.Event()
+        end = object()
+
+        def produce():
+            running.set()
+            try:
+                for item in fn(*args, **kwargs):
+                    if stopped.is_set():
+                        return
+                    items.put(item)
+                items.put(end)
+            except Exception as e:
+                items.put(e)
+
+        self.wait_for_worker(running, self.executor.submit(produce))
+        started = time.monotonic()
+        first = True
+        try:
+            while True:
+                try:
+                    item = items.get(timeout=self.deadline)
+                except queue.Empty:
+                    if first:
+                        self.record(False, time.monotonic() - started, timed_out=True)
+                    raise DeadlineExceeded(f"{self.name} stalled for more than {self.deadline}s")
+                if isinstance(item, Exception):
+                    if first:
+                        self.record(False, time.monotonic() - started)
+                    raise item
+                if first:
+                    first = False
+                    self.record(True, time.monotonic() - started)
+                if item is end:
+                    return
+                yield item
+        finally:
+            stopped.set()
+
+    def stats(self):
+        with self.lock:
+            latencies = list(self.latencies)
+            stats = {
+                "state": self.breaker.state,
+                "calls": self.calls,
+                "failures": self.failures,
+                "timeouts": self.timeouts,
+                "rejected": self.rejected,
+                "trips": self.breaker.trips,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+            }
+        if latencies:
+            stats["p50_ms"] = round(1000 * float(np.percentile(latencies, 50)), 1)
+            stats["p95_ms"] = round(1000 * float(np.percentile(latencies, 95)), 1)
+        return stats
@@ -0,0 +1,164 @@
+import collections
+import json
+import os
+import re
+import threading
+import time
+
+# Spoken filler and wake/politeness words that do not change what is being asked
+FILLERS = {
+    "en": {
+        "um", "umm", "uh", "uhh", "er", "erm", "ah", "hmm", "mm", "like", "please", "eva", "hey", "okay", "ok",
+        "so", "well", "just", "actually", "basically", "the", "a", "an",
+    },
+    "sw": {"eh", "ehh", "aah", "mmm", "hmm", "tafadhali", "basi", "sasa", "eva", "naomba", "hebu", "je"},
+}
+FILLER_PHRASES = {
+    "en": ["tell me", "i want to know", "i would like to know", "you know", "i mean"],
+    "sw": ["naomba uniambie", "niambie"],
+}
+# Words that make word order matter ("from x to y", "x before y"); otherwise tokens are sorted
+ORDER_WORDS = {
+    "en": {"from", "to", "before", "after", "than", "into", "vs", "versus", "not", "without", "minus", "over", "under"},
+    "sw": {"kutoka", "hadi", "mpaka", "kabla", "baada", "kuliko", "bila", "si"},
+}
+# Words whose answer changes with the moment it is asked; such questions are never cached
+TIME_WORDS = {
+    "en": {
+        "time", "date", "day", "today", "tonight", "tomorrow", "yesterday", "now", "current", "currently",
+        "latest", "recent", "news", "weather", "forecast", "temperature", "week", "month", "year",
+    },
+    "sw": {"saa", "tarehe", "leo", "usiku", "kesho", "jana", "hewa", "wiki", "mwezi", "mwaka", "karibuni"},
+}
+CONTRACTIONS = {
+    "what's": "what is", "who's": "who is", "where's": "where is", "how's": "how is", "it's": "it is",
+    "what're": "what are", "i'm": "i am", "you're": "you are", "don't": "do not", "can't": "cannot",
+}
+
+
+def normalize_query(query, lang="en"):
+    """Cache key for a spoken question: lower case, no punctuation, filler or stutters
+
+    Tokens are sorted unless the question contains a word that makes
+    order meaningful, so "Eva, what can you do?" and "um, what can you do
+    please" share an entry, as do "Solutech services" and "services
+    Solutech", while "from Nairobi to Mombasa" keeps its order.
+    """
+    text = query.lower().replace("’", "'")
+    for contraction, expansion in CONTRACTIONS.items():
+        text = re.sub(rf"\b{re.escape(contraction)}\b", expansion, text)
+    text = re.sub(r"[^\w\s]", " ", text)
+    for phrase in FILLER_PHRASES.get(lang, ()):
+        text = re.sub(rf"\b{phrase}\b", " ", text)
+
+    tokens = []
+    for token in text.split():
+        if token in FILLERS.get(lang, ()) or (tokens and tokens[-1] == token):
+            continue  # filler, or the recognizer repeating a word
+        tokens.append(token)
+    if not set(tokens) & ORDER_WORDS.get(lang, set()):
+        tokens.sort()
+    return " ".join(tokens)
+
+
+def time_relative(query, lang="en"):
+    """Whether the answer to ``query`` depends on when it is asked, like "what time is it" """
+    return bool(set(re.findall(r"\w+", query.lower())) & TIME_WORDS.get(lang, set()))
+
+
+class ResponseCache:
+    """Answers from vertex(), keyed by language and the normalized question
+
+    Entries expire ``ttl`` seconds after they were fetched, and at most
+    ``max_entries`` are kept, least recently used evicted first. Questions
+    about the time, date, weather or news (``time_relative``) are not
+    cached at all. With a
+    ``path`` the cache is saved as JSON after every change and reloaded on
+    startup, so answers survive restarts.
+    """
+
+    def __init__(self, path=None, ttl=24 * 3600, max_entries=256):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()  # (lang, normalized query) -> (response, fetched at)
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.skipped = 0
+        self.lock = threading.Lock()
+        if path:
+            self.load()
+
+    def get(self, query, lang):
+        """Cached answer for the question, or None"""
+        if time_relative(query, lang):
+            with self.lock:
+                self.skipped += 1
+            return None
+        key = (lang, normalize_query(query, lang))
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.time() - entry[1] > self.ttl:
+                del self.entries[key]
+                self.expired += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, query, lang, response):
+        normalized = normalize_query(query, lang)
+        if not normalized or not response or time_relative(query, lang):
+            return
+        with self.lock:
+            self.entries[(lang, normalized)] = (response, time.time())
+            self.entries.move_to_end((lang, normalized))
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        self.save()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                rows = json.load(f)
+        except Exception as e:
+            print(f"Error reading response cache: {e}")
+            return
+        now = time.time()
+        with self.lock:
+            for lang, normalized, response, fetched in rows:
+                if now - fetched <= self.ttl:
+                    self.entries[(lang, normalized)] = (response, fetched)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def save(self):
+        if not self.path:
+            return
+        with self.lock:
+            rows = [[lang, normalized, response, fetched] for (lang, normalized), (response, fetched) in self.entries.items()]
+        temp_path = f"{self.path}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(rows, f, ensure_ascii=False)
+            os.replace(temp_path, self.path)
+        except Exception as e:
+            print(f"Error writing response cache: {e}")
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "skipped": self.skipped,
+                "hit_rate": self.hits / float(lookups) if lookups else 0.0,
+                "entries": len(self.entries),
+            }
@@ -0,0 +1,91 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class SpeculativePrefetch:
+    """Starts answering a command while the user is still dictating it
+
+    ``speculate()`` is called with the command so far after every segment,
+    and ``fetch(command)`` runs for it in the background, at most
+    ``max_outstanding`` at a time. When the limit is reached the newest
+    command waits for a free slot, replacing any older one still waiting,
+    since the latest text is the likeliest final command. ``take()`` returns
+    the answer when the final command has the same ``key`` as a speculated
+    one, waiting for it if it is still in flight; all other work is
+    discarded.
+    """
+
+    def __init__(self, fetch, key=lambda command: command, max_outstanding=2):
+        self.fetch = fetch
+        self.key = key
+        self.max_outstanding = max_outstanding
+        self.executor = ThreadPoolExecutor(max_workers=max_outstanding, thread_name_prefix="speculation")
+        self.futures = {}  # key -> Future, for the command being dictated only
+        self.waiting = None  # (key, command) held back by the limit
+        self.outstanding = 0
+        self.lock = threading.RLock()  # done callbacks may run inside submit
+
+        self.started = 0
+        self.taken = 0
+        self.used = 0
+        self.discarded = 0
+
+    def speculate(self, command):
+        key = self.key(command)
+        with self.lock:
+            if not key or key in self.futures:
+                return
+            if self.outstanding >= self.max_outstanding:
+                self.waiting = (key, command)
+                return
+            self._start(key, command)
+
+    def _start(self, key, command):
+        self.outstanding += 1
+        self.started += 1
+        future = self.executor.submit(self.fetch, command)
+        self.futures[key] = future
+        future.add_done_callback(self._finished)
+
+    def _finished(self, future):
+        with self.lock:
+            self.outstanding -= 1
+            if self.waiting is not None:
+                key, command = self.waiting
+                self.waiting = None
+                if key not in self.futures:
+                    self._start(key, command)
+
+    def take(self, command, timeout=None):
+        """Speculated answer for the final ``command``, or None; discards everything else"""
+        key = self.key(command)
+        with self.lock:
+            self.taken += 1
+            future = self.futures.pop(key, None)
+            self.discard()
+        if future is None:
+            return None
+        try:
+            answer = future.result(timeout)
+        except Exception as e:
+            print(f"Error in speculative request: {e}")
+            return None
+        with self.lock:
+            self.used += 1
+        return answer
+
+    def discard(self):
+        """Drop all speculation; fetches already running finish and are ignored"""
+        with self.lock:
+            self.discarded += len(self.futures)
+            self.futures = {}
+            self.waiting = None
+
+    def stats(self):
+        with self.lock:
+            return {
+                "started": self.started,
+                "used": self.used,
+                "discarded": self.discarded,
+                "hit_rate": self.used / float(self.taken) if self.taken else 0.0,
+            }
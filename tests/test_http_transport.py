@@ -0,0 +1,92 @@
+import base64
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import speech_recognition as sr
+from http_transport import HttpTransport, recognize_google
+from tts import gtts_mp3
+
+RECOGNITION_REPLY = (
+    b'{"result":[]}\n'
+    b'{"result":[{"alternative":[{"transcript":"hello eva","confidence":0.9}],"final":true}],"result_index":0}\n'
+)
+AUDIO = b"ID3 not really an mp3"
+
+
+class StandIn(BaseHTTPRequestHandler):
+    """Answers like the Web Speech API on /speech and like gTTS's batchexecute elsewhere"""
+
+    protocol_version = "HTTP/1.1"  # keep-alive, as the real services
+    connections = []
+
+    def setup(self):
+        super().setup()
+        self.connections.append(self.client_address)
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, body):
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def do_HEAD(self):
+        self.reply(b"")
+
+    def do_POST(self):
+        data = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.path.startswith("/speech"):
+            self.reply(RECOGNITION_REPLY)
+        else:
+            assert data.startswith(b"f.req=")
+            audio = base64.b64encode(AUDIO).decode("ascii")
+            self.reply((')]}\'\n\n[["wrb.fr","jQ1olc","[\\"%s\\"]",null]]\n' % audio).encode("utf-8"))
+
+
+@pytest.fixture
+def server():
+    StandIn.connections = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_recognition_and_synthesis_share_one_connection(server):
+    transport = HttpTransport()
+    audio = sr.AudioData(b"\0\0" * 16000, 16000, 2)
+
+    for lang in ("en-US", "en-GB", "en-IN"):
+        assert recognize_google(transport, audio, lang, endpoint=f"{server}/speech-api/v2/recognize") == "hello eva"
+    for _ in range(3):
+        assert gtts_mp3("Hello there.", "en", 5, transport, f"{server}/batchexecute") == AUDIO
+
+    assert len(StandIn.connections) == 1
+    stats = transport.stats()
+    assert stats["requests"] == 6
+    assert stats["connections"] == 1
+    assert stats["reused"] == 5
+    assert stats["reuse_rate"] == pytest.approx(5 / 6.0)
+    assert stats["failures"] == 0
+    transport.close()
+
+
+def test_warmed_connections_are_reused(server):
+    transport = HttpTransport()
+    assert transport.warm_up([f"{server}/speech-api/v2/recognize"], connections=2) == 2
+    assert len(StandIn.connections) == 2
+
+    audio = sr.AudioData(b"\0\0" * 16000, 16000, 2)
+    for _ in range(4):
+        recognize_google(transport, audio, "en-US", endpoint=f"{server}/speech-api/v2/recognize")
+
+    assert len(StandIn.connections) == 2  # every request rode a warmed connection
+    stats = transport.stats()
+    assert stats["warmed"] == 2
+    assert stats["connections"] == 2
+    assert stats["reused"] == stats["requests"] - 2
+    transport.close()
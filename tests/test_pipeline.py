@@ -0,0 +1,36 @@
+import threading
+import time
+
+from pipeline import SegmentPipeline
+
+
+class Source:
+    """Capture that, like a microphone stream, only hears interrupts once its source is open"""
+
+    def __init__(self, open_delay):
+        self.open_delay = open_delay
+        self.generation = 0
+        self.opened = threading.Event()
+
+    def interrupt(self):
+        self.generation += 1
+
+    def capture(self):
+        time.sleep(self.open_delay)  # stop() can interrupt in here, before the source exists
+        generation = self.generation
+        self.opened.set()
+        deadline = time.monotonic() + 10
+        while self.generation == generation and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return None
+
+
+def test_stop_waits_for_a_capture_that_opened_after_the_interrupt():
+    source = Source(open_delay=0.3)
+    pipeline = SegmentPipeline(source.capture, lambda audio: ("", 0), interrupt=source.interrupt).start()
+    time.sleep(0.1)
+    started = time.monotonic()
+    pipeline.stop()
+    assert not pipeline.thread.is_alive()
+    assert source.opened.is_set()
+    assert time.monotonic() - started < 2
@@ -0,0 +1,21 @@
+import threading
+
+import pytest
+
+from resilience import CircuitBreaker, DeadlineExceeded, Guard
+
+
+def test_call_without_a_free_worker_gives_up_at_the_deadline():
+    guard = Guard("stuck", deadline=0.2, breaker=CircuitBreaker(min_calls=1, cooldown=0.0), max_workers=1)
+    release = threading.Event()
+    with pytest.raises(DeadlineExceeded):
+        guard.call(release.wait)  # hangs the only worker
+    # half open now; this call takes the probe slot and must give it back
+    with pytest.raises(DeadlineExceeded, match="no free worker"):
+        guard.call(lambda: "answer")
+    with pytest.raises(DeadlineExceeded, match="no free worker"):
+        list(guard.stream(lambda: iter("abc")))
+    assert guard.stats()["timeouts"] == 3
+    release.set()
+    assert guard.call(lambda: "answer") == "answer"
+    assert guard.breaker.state == "closed"
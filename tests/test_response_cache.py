@@ -0,0 +1,17 @@
+from response_cache import ResponseCache, normalize_query
+
+
+def test_modal_verbs_keep_questions_apart():
+    assert normalize_query("What can you do?") != normalize_query("What would you do?")
+    assert normalize_query("Eva, what can you do?") == normalize_query("um, what can you do please")
+
+
+def test_time_relative_questions_are_not_cached():
+    cache = ResponseCache()
+    cache.put("What time is it now?", "en", "It is ten o'clock.")
+    cache.put("Hali ya hewa leo ikoje?", "sw", "Jua kali.")
+    assert cache.get("What time is it now?", "en") is None
+    assert cache.get("Hali ya hewa leo ikoje?", "sw") is None
+    assert cache.stats()["entries"] == 0
+    cache.put("What is Solutech?", "en", "A software company.")
+    assert cache.get("what is solutech", "en") == "A software company."
@@ -0,0 +1,20 @@
+import time
+
+from recognition import SpokenText
+
+
+def test_answer_given_right_after_the_prompt_is_kept():
+    spoken_text = SpokenText()
+    ended = spoken_text.add("continue or say finished eva")
+    ended()
+    later = time.time() + 0.6
+    assert spoken_text.strip("finished eva", later, later + 1.5) == "finished eva"
+
+
+def test_echo_captured_during_playback_is_removed():
+    spoken_text = SpokenText()
+    ended = spoken_text.add("continue or say finished eva")
+    now = time.time()
+    assert spoken_text.strip("open the finished eva", now - 1.0, now + 0.5) == "open the"
+    ended()
+    assert spoken_text.strip("open the finished eva", now - 1.0, time.time()) == "open the"
@@ -0,0 +1,37 @@
+import numpy as np
+from wakeword import WakeWordSpotter
+
+
+def take(duration, seed, sample_rate=16000):
+    """A voiced, pitch-gliding stand-in for one spoken take of the wake phrase"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration * sample_rate)) / float(sample_rate)
+    pitch = 120 + 60 * t / duration
+    phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 8)) + rng.normal(0, 0.05, len(t))
+    silence = np.zeros(sample_rate // 5)
+    return np.concatenate([silence, voiced * 6000, silence]).astype(np.int16)
+
+
+def test_take_far_longer_than_the_enrolled_ones_is_rejected(tmp_path):
+    spotter = WakeWordSpotter(["hey eva"], str(tmp_path / "templates.npz"))
+    assert spotter.enroll("hey eva", [take(0.3, 1), take(0.35, 2)]) == 2
+    assert spotter.enroll("hey eva", [take(1.4, 3)]) == 0
+
+    assert len(spotter.templates["hey eva"]) == 2
+    assert np.isfinite(spotter.thresholds["hey eva"])
+
+
+def test_templates_that_cannot_align_never_give_an_infinite_threshold(tmp_path):
+    spotter = WakeWordSpotter(["hey eva"], str(tmp_path / "templates.npz"))
+    short, _ = spotter.extractor(take(0.3, 1))
+    long, _ = spotter.extractor(take(1.4, 3))
+    spotter.templates["hey eva"] = [short, long]  # as enrolled before lengths were checked
+
+    spotter.enroll("hey eva", [])
+
+    # The long take cannot align inside the short one; only the finite cost counts
+    assert np.isfinite(spotter.thresholds.get("hey eva", spotter.default_threshold))
+    assert np.isfinite(WakeWordSpotter(["hey eva"], str(tmp_path / "templates.npz")).thresholds["hey eva"])
+    noise = np.random.default_rng(0).normal(0, 3000, 32000).astype(np.int16)
+    assert spotter.score(spotter.extractor(noise)[0]) is None
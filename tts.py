@@ -0,0 +1,568 @@
+import base64
+import io
+import os
+import queue
+import re
+import subprocess
+import sys
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from pydub import AudioSegment
+
+try:
+    import miniaudio
+except ImportError:  # MP3s are decoded by pydub through an ffmpeg pipe instead
+    miniaudio = None
+
+# Words ending in a period that do not end a sentence, English and Swahili
+# (lower case, without the final period)
+ABBREVIATIONS = {
+    "mr", "mrs", "ms", "dr", "prof", "st", "mt", "vs", "etc", "e.g", "i.e", "inc", "ltd", "approx", "dept",
+    "jan", "feb", "mar", "apr", "jun", "jul", "aug", "sep", "sept", "oct", "nov", "dec",
+    "bw", "bi", "dkt", "mh", "n.k", "k.m", "y.a", "taz",
+}
+
+# Closing punctuation (. ! ? …) plus trailing quotes/brackets, followed by whitespace
+SENTENCE_END = re.compile(r"([.!?…]+)[\"'”’)\]]*(?=\s|$)|\n\s*\n|\n")
+
+
+def sentence_boundaries(text):
+    """End offsets of the sentences in ``text``; anything after the last one is unfinished
+
+    Breaks after ``.``, ``!``, ``?``, ``…`` and line breaks, but not after
+    abbreviations, initials or decimal points.
+    """
+    ends = []
+    start = 0
+    for match in SENTENCE_END.finditer(text):
+        if match.group(1) == ".":
+            words = text[start:match.start()].split()
+            word = words[-1].lower().lstrip("(\"'") if words else ""
+            if word in ABBREVIATIONS or (len(word) == 1 and word.isalpha()):
+                continue
+        ends.append(match.end())
+        start = match.end()
+    return ends
+
+
+def split_sentences(text, min_length=20):
+    """Split ``text`` into sentences for incremental synthesis
+
+    Sentences shorter than ``min_length`` characters are joined to the next
+    one so very short fragments do not each pay a synthesis round trip.
+    """
+    sentences = []
+    start = 0
+    for end in sentence_boundaries(text) + [len(text)]:
+        sentence = text[start:end].strip()
+        if sentence:
+            sentences.append(sentence)
+        start = end
+
+    merged = []
+    for sentence in sentences:
+        if merged and len(merged[-1]) < min_length:
+            merged[-1] = f"{merged[-1]} {sentence}"
+        else:
+            merged.append(sentence)
+    return merged
+
+
+def stream_sentences(chunks, min_length=20):
+    """Yield sentences from text that arrives in pieces, as soon as each one is complete
+
+    A boundary only counts once something follows it, so "3." is not cut
+    off before ".5" arrives. Short sentences are joined to the next one as
+    in ``split_sentences``, and whatever is left is yielded at the end.
+    """
+    buffer = ""
+    short = ""  # finished sentences too short to be spoken on their own yet
+    for chunk in chunks:
+        buffer += chunk
+        consumed = 0
+        for end in sentence_boundaries(buffer):
+            if end >= len(buffer):
+                break
+            sentence = buffer[consumed:end].strip()
+            consumed = end
+            if sentence:
+                short = f"{short} {sentence}" if short else sentence
+                if len(short) >= min_length:
+                    yield short
+                    short = ""
+        buffer = buffer[consumed:]
+
+    rest = f"{short} {buffer.strip()}".strip()
+    if rest:
+        yield rest
+
+
+def play_sentences(sentences, render, play, lookahead=1):
+    """Play ``render(sentence)`` for each sentence in order, rendering ahead of playback
+
+    Up to ``lookahead`` sentences are synthesized on a worker thread while the
+    current one plays, so time to first audio depends only on the first
+    sentence. ``sentences`` is read on its own thread, so it can be a
+    generator still waiting for text (a streamed answer) without holding up
+    sentences that are already rendered. A sentence that fails to render is
+    skipped, and a ``play`` that returns False (the listener interrupted)
+    drops the rest of the text.
+    """
+    executor = ThreadPoolExecutor(max_workers=max(1, lookahead), thread_name_prefix="tts-lookahead")
+    pending = queue.Queue(maxsize=lookahead + 1)  # render futures in sentence order, then None
+    stopped = threading.Event()
+
+    def offer(item):
+        # Wait for room unless playback has been abandoned
+        while not stopped.is_set():
+            try:
+                pending.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def feed():
+        try:
+            for sentence in sentences:
+                if stopped.is_set():
+                    break
+                offer(executor.submit(render, sentence))
+        except Exception as e:
+            if not stopped.is_set():
+                print(f"Error reading sentences: {e}")
+        finally:
+            if hasattr(sentences, "close"):
+                sentences.close()
+            offer(None)
+
+    threading.Thread(target=feed, name="tts-sentences", daemon=True).start()
+    try:
+        while True:
+            future = pending.get()
+            if future is None:
+                break
+            try:
+                sound = future.result()
+            except Exception as e:
+                print(f"Error synthesizing sentence: {e}")
+                continue
+            if play(sound) is False:
+                break
+    finally:
+        stopped.set()
+        executor.shutdown(wait=False)
+
+
+def gtts_mp3(text, lang, timeout=None, transport=None, endpoint=None):
+    """MP3 bytes for ``text`` from gTTS, kept in memory
+
+    With a ``transport`` (http_transport.HttpTransport) the requests reuse
+    its keep-alive connections, and go to ``endpoint`` when one is given.
+    """
+    from gtts import gTTS
+
+    tts = gTTS(text=text, lang=lang, timeout=timeout)
+    if transport is not None:
+        return b"".join(gtts_stream(tts, transport, endpoint))
+    buffer = io.BytesIO()
+    tts.write_to_fp(buffer)
+    return buffer.getvalue()
+
+
+def gtts_stream(tts, transport, endpoint=None):
+    """gTTS.stream() over a shared transport instead of a new session per request"""
+    import requests
+    from gtts.tts import gTTSError
+
+    for request in tts._prepare_requests():
+        try:
+            response = transport.post(endpoint or request.url, data=request.body, headers=dict(request.headers),
+                                      timeout=tts.timeout)
+            response.raise_for_status()
+        except requests.HTTPError as e:
+            raise gTTSError(tts=tts, response=e.response)
+        except requests.RequestException:
+            raise gTTSError(tts=tts)
+
+        for line in response.iter_lines(chunk_size=1024):
+            line = line.decode("utf-8")
+            if "jQ1olc" not in line:
+                continue
+            audio = re.search(r'jQ1olc","\[\\"(.*)\\"]', line)
+            if audio is None:
+                raise gTTSError(tts=tts, response=response)
+            yield base64.b64decode(audio.group(1).encode("ascii"))
+
+
+def decode_mp3(data):
+    """Decode MP3 bytes to 16-bit PCM without touching the disk
+
+    Uses miniaudio in-process when it is installed; otherwise pydub pipes the
+    bytes through ffmpeg. Neither needs a file name, so any number of threads
+    can synthesize at once.
+    """
+    if miniaudio is None:
+        return AudioSegment.from_file(io.BytesIO(data), format="mp3")
+    decoded = miniaudio.mp3_read_s16(bytes(data))
+    return AudioSegment(
+        data=decoded.samples.tobytes(),
+        sample_width=2,
+        frame_rate=decoded.sample_rate,
+        channels=decoded.nchannels
+    )
+
+
+class SpeechBackend:
+    """Text-to-speech engine behind speech()"""
+
+    name = None
+
+    @property
+    def voice(self):
+        """Identifies the voice in speech cache keys"""
+        return self.name
+
+    def synthesize(self, text, lang):
+        """Return ``text`` spoken in ``lang`` ('en', 'sw') as an AudioSegment"""
+        raise NotImplementedError
+
+    def stats(self):
+        return {}
+
+
+class GoogleTTSBackend(SpeechBackend):
+    """Google Translate's TTS endpoint through gTTS; needs the network
+
+    With a ``guard`` (resilience.Guard) each request gets its deadline,
+    hedging and circuit breaker; with a ``transport`` it reuses pooled
+    connections.
+    """
+
+    name = "gtts"
+
+    def __init__(self, guard=None, timeout=None, transport=None, endpoint=None):
+        self.guard = guard
+        self.timeout = timeout  # socket timeout for each HTTP request
+        self.transport = transport
+        self.endpoint = endpoint
+
+    def synthesize(self, text, lang):
+        if self.guard is None:
+            return decode_mp3(gtts_mp3(text, lang, self.timeout, self.transport, self.endpoint))
+        return decode_mp3(self.guard.call(gtts_mp3, text, lang, self.timeout, self.transport, self.endpoint))
+
+
+class FallbackSpeechBackend(SpeechBackend):
+    """``primary`` while it works, a local engine from ``create_fallback`` when it fails
+
+    Fallback speech is marked ``degraded`` so the speech cache does not keep
+    it under the primary voice.
+    """
+
+    def __init__(self, primary, create_fallback):
+        self.primary = primary
+        self.create_fallback = create_fallback
+        self.fallback = None
+        self.lock = threading.Lock()
+
+    @property
+    def name(self):
+        return self.primary.name
+
+    @property
+    def voice(self):
+        return self.primary.voice
+
+    def local(self):
+        with self.lock:
+            if self.fallback is None:
+                self.fallback = self.create_fallback()
+            return self.fallback
+
+    def synthesize(self, text, lang):
+        try:
+            return self.primary.synthesize(text, lang)
+        except Exception as e:
+            print(f"Error with {self.primary.name} speech, using the local engine: {e}")
+        sound = self.local().synthesize(text, lang)
+        sound.degraded = True
+        return sound
+
+    def stats(self):
+        return self.primary.stats()
+
+
+class EspeakBackend(SpeechBackend):
+    """espeak formant synthesizer, offline and instant but robotic"""
+
+    name = "espeak"
+
+    def __init__(self, executable="espeak", speed=160):
+        self.executable = executable
+        self.speed = speed
+
+    def synthesize(self, text, lang):
+        result = subprocess.run(
+            [self.executable, "-v", lang, "-s", str(self.speed), "--stdout", text],
+            capture_output=True,
+            check=True
+        )
+        # espeak streams its WAV, so the header sizes are placeholders; read to the end
+        with wave.open(io.BytesIO(result.stdout), "rb") as wav:
+            sample_rate, width, channels = wav.getframerate(), wav.getsampwidth(), wav.getnchannels()
+            data = wav.readframes(wav.getnframes())
+        return AudioSegment(data=data, sample_width=width, frame_rate=sample_rate, channels=channels)
+
+
+class Tacotron2Backend(SpeechBackend):
+    """The custom Tacotron2 voice from ttsmodel/ vocoded with WaveGlow, loaded once and kept warm
+
+    ``code_dir`` is a checkout of the training repository (ARPAtaco2, with its
+    waveglow submodule), which provides the model classes and text cleaners.
+    Audio comes back as PCM straight from the vocoder; nothing touches the
+    network or the disk after loading. ``stream()`` yields audio while the
+    decoder is still running, for playback that starts after the first chunk.
+    """
+
+    name = "tacotron2"
+    silence = -11.5129  # log(1e-5), the mel value of silence; pads batched spectrograms
+    # Recurrent state the decoder keeps on itself between steps
+    decoder_state = ("attention_hidden", "attention_cell", "decoder_hidden", "decoder_cell", "attention_weights",
+                     "attention_weights_cum", "attention_context", "memory", "processed_memory", "mask")
+
+    def __init__(self, checkpoint_path, waveglow_path, code_dir="TTS-TT2", device=None, sigma=0.666, threads=4):
+        import torch
+
+        for path in (os.path.join(code_dir, "waveglow"), code_dir):
+            if path not in sys.path:
+                sys.path.insert(0, path)  # the WaveGlow pickle refers to the 'glow' module
+        from hparams import create_hparams
+        from model import Tacotron2
+        from text import text_to_sequence
+
+        if threads:
+            torch.set_num_threads(threads)
+        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        self.sigma = sigma
+        self.text_to_sequence = text_to_sequence
+        self.checkpoint_name = os.path.splitext(os.path.basename(checkpoint_path))[0]
+
+        self.hparams = create_hparams()
+        self.hparams.sampling_rate = 22050  # same as training
+        self.hparams.max_wav_value = 32768.0
+        self.sample_rate = self.hparams.sampling_rate
+
+        print(f"Loading Tacotron2 voice '{self.checkpoint_name}' and WaveGlow on {self.device}...")
+        self.model = Tacotron2(self.hparams)
+        checkpoint = torch.load(checkpoint_path, map_location="cpu")
+        self.model.load_state_dict(checkpoint["state_dict"])
+        self.model.to(self.device).eval()
+
+        self.waveglow = torch.load(waveglow_path, map_location="cpu", weights_only=False)["model"]
+        self.waveglow.to(self.device).eval()
+        for layer in self.waveglow.convinv:
+            layer.float()
+
+        self.lock = threading.Lock()  # one inference at a time per loaded model
+        self.streams = 0
+        self.first_audio_time = 0.0  # summed time to first audio over all streams
+        self.last_first_audio = 0.0
+        self.stream_compute_time = 0.0
+        self.stream_audio_time = 0.0
+        self.synthesize("Hello.", "en")  # warm-up, so the first real prompt is not the slow one
+
+    @property
+    def voice(self):
+        return f"{self.name}:{self.checkpoint_name}"
+
+    def encode(self, text):
+        import torch
+
+        sequence = np.array(self.text_to_sequence(text, self.hparams.text_cleaners))
+        return torch.from_numpy(sequence).long().unsqueeze(0).to(self.device)
+
+    def to_pcm(self, audio):
+        samples = audio.float().cpu().numpy().reshape(-1) * self.hparams.max_wav_value
+        return np.clip(samples, -32768, 32767).astype(np.int16).tobytes()
+
+    def synthesize(self, text, lang):
+        import torch
+
+        sequence = self.encode(text)
+        with self.lock, torch.no_grad():
+            _, mel_outputs_postnet, _, _ = self.model.inference(sequence)
+            audio = self.waveglow.infer(mel_outputs_postnet, sigma=self.sigma)
+        return AudioSegment(
+            data=self.to_pcm(audio),
+            sample_width=2,
+            frame_rate=self.sample_rate,
+            channels=1
+        )
+
+    def decode_steps(self, memory, mask):
+        """Run the autoregressive decoder one step at a time
+
+        Yields each mel frame for the whole batch along with the rows whose
+        gate has fired so far, stopping once every row has ended.
+        """
+        import torch
+
+        decoder = self.model.decoder
+        decoder_input = decoder.get_go_frame(memory)
+        decoder.initialize_decoder_states(memory, mask=mask)
+        finished = torch.zeros(memory.size(0), dtype=torch.bool)
+        for _ in range(decoder.max_decoder_steps):
+            mel_output, gate_output, _ = decoder.decode(decoder.prenet(decoder_input))
+            finished = finished | (torch.sigmoid(gate_output.squeeze(1)).cpu() > decoder.gate_threshold)
+            yield mel_output, finished
+            if finished.all():
+                return
+            decoder_input = mel_output
+
+    def save_decoder(self):
+        decoder = self.model.decoder
+        return {name: getattr(decoder, name) for name in self.decoder_state}
+
+    def restore_decoder(self, state):
+        for name, value in state.items():
+            setattr(self.model.decoder, name, value)
+
+    def decode(self, memory, mask):
+        """Decode a padded batch; returns the batched mel spectrogram and each row's frame count"""
+        import torch
+
+        frames = torch.zeros(memory.size(0), dtype=torch.long)
+        ended = torch.zeros(memory.size(0), dtype=torch.bool)
+        mel_outputs = []
+        for mel_output, finished in self.decode_steps(memory, mask):
+            mel_outputs.append(mel_output)
+            frames += (~ended).long()
+            ended = finished
+        return torch.stack(mel_outputs, dim=2), frames  # one frame per decoder step
+
+    def vocode_frames(self, frames, start, end, context, postnet_context):
+        """Audio samples for mel ``frames[start - context:end + context]``, postnet applied with its own context"""
+        import torch
+
+        low, high = max(0, start - context), min(len(frames), end + context)
+        mel_low, mel_high = max(0, low - postnet_context), min(len(frames), high + postnet_context)
+        mel = torch.stack(frames[mel_low:mel_high], dim=2)
+        mel = (mel + self.model.postnet(mel))[:, :, low - mel_low:high - mel_low]
+        audio = self.waveglow.infer(mel, sigma=self.sigma)
+        return audio.float().cpu().numpy().reshape(-1) * self.hparams.max_wav_value, low
+
+    def stream(self, text, lang, first_chunk_frames=24, chunk_frames=80, overlap_frames=4, postnet_context=10,
+               fade_samples=256):
+        """Yield int16 PCM for ``text`` while the decoder is still producing mel frames
+
+        The first ``first_chunk_frames`` frames are vocoded as soon as they
+        exist, later ones ``chunk_frames`` at a time. Each chunk is vocoded
+        with ``overlap_frames`` of neighbouring mel on both sides (the postnet
+        gets ``postnet_context`` more, its receptive field), and consecutive
+        chunks are crossfaded over ``fade_samples`` so WaveGlow's per-call
+        noise leaves no seams.
+
+        The model lock is held only while a chunk is decoded and vocoded, never
+        while the consumer has it, so other synthesis can run between chunks
+        and an abandoned stream holds nothing. The decoder's recurrent state
+        is saved after each chunk and restored before the next.
+        """
+        import torch
+
+        hop = self.hparams.hop_length
+        started = time.perf_counter()
+        compute_time = 0.0
+        first_audio = None
+        audio_samples = 0
+        with self.lock, torch.no_grad():
+            sequence = self.encode(text)
+            memory = self.model.encoder.inference(self.model.embedding(sequence).transpose(1, 2))
+            mask = torch.zeros(memory.shape[:2], dtype=torch.bool, device=self.device)
+        steps = self.decode_steps(memory, mask)  # initializes the decoder state on its first step
+        state = None
+        frames = []  # decoded mel frames, (1, n_mel_channels) each
+        start = 0
+        tail = None  # end of the previous chunk, held back for the crossfade
+        finished = False
+        resumed = time.perf_counter()
+        while not finished:
+            end = start + (chunk_frames if start else first_chunk_frames)
+            with self.lock, torch.no_grad():
+                if state is not None:
+                    self.restore_decoder(state)
+                while not finished and len(frames) < end + overlap_frames + postnet_context:
+                    mel_output, ended = next(steps, (None, None))
+                    if mel_output is None:
+                        break
+                    frames.append(mel_output)
+                    finished = bool(ended.all())
+                state = self.save_decoder()
+                finished = finished or len(frames) < end + overlap_frames + postnet_context
+                end = len(frames) if finished else end
+                samples, low = self.vocode_frames(frames, start, end, overlap_frames, postnet_context)
+
+            begin = (start - low) * hop - (len(tail) if tail is not None else 0)
+            piece = samples[begin:(end - low) * hop]
+            if tail is not None:
+                ramp = np.linspace(0.0, 1.0, len(tail))
+                piece[:len(tail)] = tail * (1 - ramp) + piece[:len(tail)] * ramp
+            if not finished:
+                tail = piece[-fade_samples:].copy()
+                piece = piece[:-fade_samples]
+            start = end
+
+            pcm = np.clip(piece, -32768, 32767).astype(np.int16).tobytes()
+            audio_samples += len(piece)
+            compute_time += time.perf_counter() - resumed
+            if first_audio is None:
+                first_audio = time.perf_counter() - started
+            yield pcm
+            resumed = time.perf_counter()
+
+        with self.lock:
+            self.streams += 1
+            self.first_audio_time += first_audio or 0.0
+            self.last_first_audio = first_audio or 0.0
+            self.stream_compute_time += compute_time
+            self.stream_audio_time += audio_samples / float(self.sample_rate)
+
+    def stats(self):
+        """Streaming synthesis metrics: time to first audio and real-time factor"""
+        with self.lock:
+            return {
+                "streams": self.streams,
+                "mean_ttfa_ms": round(1000 * self.first_audio_time / self.streams, 1) if self.streams else 0.0,
+                "last_ttfa_ms": round(1000 * self.last_first_audio, 1),
+                "realtime_factor": round(self.stream_compute_time / self.stream_audio_time, 3)
+                if self.stream_audio_time else 0.0,
+            }
+
+    def synthesize_batch(self, texts):
+        """PCM for each of ``texts``, encoded, decoded and vocoded together as one padded batch"""
+        import torch
+
+        sequences = [self.text_to_sequence(text, self.hparams.text_cleaners) for text in texts]
+        order = sorted(range(len(texts)), key=lambda i: -len(sequences[i]))  # packed encoder wants longest first
+        lengths = torch.tensor([len(sequences[i]) for i in order], dtype=torch.long)
+        padded = torch.zeros(len(texts), int(lengths[0]), dtype=torch.long)
+        for row, i in enumerate(order):
+            padded[row, :len(sequences[i])] = torch.tensor(sequences[i], dtype=torch.long)
+
+        with self.lock, torch.no_grad():
+            padded = padded.to(self.device)
+            embedded = self.model.embedding(padded).transpose(1, 2)
+            memory = self.model.encoder(embedded, lengths)
+            mask = torch.arange(memory.size(1), device=self.device)[None, :] >= lengths.to(self.device)[:, None]
+            mels, frames = self.decode(memory, mask)
+            mels = mels + self.model.postnet(mels)
+            padding = torch.arange(mels.size(2))[None, :] >= frames[:, None]
+            mels = mels.masked_fill(padding[:, None, :].to(self.device), self.silence)
+            audio = self.waveglow.infer(mels, sigma=self.sigma)
+
+        results = [None] * len(texts)
+        for row, i in enumerate(order):
+            results[i] = self.to_pcm(audio[row, :int(frames[row]) * self.hparams.hop_length])
+        return results
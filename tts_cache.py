@@ -0,0 +1,154 @@
+import collections
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pydub import AudioSegment
+
+
+class SpeechCache:
+    """Content-addressed cache of synthesized speech
+
+    Entries are keyed by (text, lang, voice). Decoded PCM is held in a
+    size-bounded in-memory LRU, backed by WAV files on disk that survive
+    restarts; both tiers load without any network or MP3 decoding. The disk
+    tier is an LRU too, capped at ``max_disk_bytes`` and ordered by file
+    modification time across restarts. Files are written by a background
+    thread so playback never waits for the disk, and only for ``put`` calls
+    that ask to persist.
+    """
+
+    def __init__(self, directory="tts_cache", max_memory_bytes=64 * 1024 * 1024, max_disk_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.memory = collections.OrderedDict()
+        self.memory_bytes = 0
+        self.disk = collections.OrderedDict()  # key -> file size, least recently used first
+        self.disk_bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tts-cache-write")
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self.scan()
+
+    @staticmethod
+    def key(text, lang, voice):
+        return hashlib.sha256(f"{voice}\0{lang}\0{text}".encode("utf-8")).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.wav")
+
+    def scan(self):
+        """Index the files already on disk, least recently used first"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".wav"):
+                info = os.stat(os.path.join(self.directory, name))
+                entries.append((info.st_mtime, name[:-len(".wav")], info.st_size))
+        with self.lock:
+            for _, key, size in sorted(entries):
+                self.disk[key] = size
+                self.disk_bytes += size
+            self.evict_disk()
+
+    def evict_disk(self):
+        while self.disk_bytes > self.max_disk_bytes and self.disk:
+            key, size = self.disk.popitem(last=False)
+            self.disk_bytes -= size
+            try:
+                os.remove(self.path(key))
+            except OSError as e:
+                print(f"Error evicting cached speech: {e}")
+
+    def get(self, text, lang, voice):
+        """Cached AudioSegment for the utterance, or None"""
+        key = self.key(text, lang, voice)
+        with self.lock:
+            sound = self.memory.get(key)
+            if sound is not None:
+                self.memory.move_to_end(key)
+                self.hits += 1
+                return sound
+
+        with self.lock:
+            on_disk = key in self.disk
+            if on_disk:
+                self.disk.move_to_end(key)
+        if on_disk:
+            try:
+                sound = AudioSegment.from_wav(self.path(key))
+                os.utime(self.path(key))  # recency survives a restart
+            except Exception as e:
+                print(f"Error reading cached speech: {e}")
+            else:
+                with self.lock:
+                    self.disk_hits += 1
+                self.remember(key, sound)
+                return sound
+
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def put(self, text, lang, voice, sound, persist=True):
+        """Cache ``sound`` in memory, and on disk too when ``persist`` is set"""
+        if getattr(sound, "degraded", False):
+            return  # stand-in speech from a fallback engine, not this voice
+        key = self.key(text, lang, voice)
+        self.remember(key, sound)
+        if self.directory and persist:
+            self.writer.submit(self.write, key, sound)
+
+    def write(self, key, sound):
+        temp_path = f"{self.path(key)}.{threading.get_ident()}.tmp"
+        try:
+            sound.export(temp_path, format="wav")
+            os.replace(temp_path, self.path(key))
+            size = os.path.getsize(self.path(key))
+        except Exception as e:
+            print(f"Error writing cached speech: {e}")
+            return
+        with self.lock:
+            self.disk_bytes += size - self.disk.pop(key, 0)
+            self.disk[key] = size
+            self.evict_disk()
+
+    def remember(self, key, sound):
+        size = len(sound.raw_data)
+        if size > self.max_memory_bytes:
+            return
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                return
+            self.memory[key] = sound
+            self.memory_bytes += size
+            while self.memory_bytes > self.max_memory_bytes:
+                _, evicted = self.memory.popitem(last=False)
+                self.memory_bytes -= len(evicted.raw_data)
+
+    def get_or_synthesize(self, text, lang, voice, synthesize, persist=True):
+        """Cached speech for ``text``, calling ``synthesize(text)`` only on a miss"""
+        sound = self.get(text, lang, voice)
+        if sound is None:
+            sound = synthesize(text)
+            self.put(text, lang, voice, sound, persist=persist)
+        return sound
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / float(lookups) if lookups else 0.0,
+                "entries": len(self.memory),
+                "memory_bytes": self.memory_bytes,
+                "disk_entries": len(self.disk),
+                "disk_bytes": self.disk_bytes,
+            }
@@ -0,0 +1,263 @@
+import argparse
+import json
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+from pydub import AudioSegment
+from tts import SpeechBackend, Tacotron2Backend
+
+DEFAULT_SOCKET = "/tmp/eva-tts.sock"
+FRAME_HEADER = struct.Struct(">I")  # length prefix of each PCM frame; a zero length ends the stream
+
+
+class SynthesisRequest:
+    """One utterance waiting for, or streaming out of, the synthesis server"""
+
+    def __init__(self, text, lang):
+        self.text = text
+        self.lang = lang
+        self.chunks = queue.Queue()  # PCM pieces, then None; an Exception if synthesis failed
+        self.received = time.perf_counter()
+        self.cancelled = threading.Event()  # set once the client has gone; its audio is no longer wanted
+
+
+class SynthesisServer:
+    """Keeps one Tacotron2Backend resident and shares it between assistant sessions
+
+    Sessions connect over a Unix socket, one connection per utterance.
+    Requests arriving within ``batch_window`` seconds of each other, up to
+    ``max_batch_size``, are decoded and vocoded together as one padded
+    batch, and each caller's audio is streamed back in ``chunk_duration``
+    pieces as soon as its batch is done. A request with nobody to batch with
+    is streamed chunk by chunk while it is still being decoded. A client
+    that hangs up cancels its request: it is dropped if still queued, and a
+    lone request stops being decoded.
+    """
+
+    def __init__(self, backend, address=DEFAULT_SOCKET, max_batch_size=8, batch_window=0.02, chunk_duration=0.5):
+        self.backend = backend
+        self.address = address
+        self.max_batch_size = max_batch_size
+        self.batch_window = batch_window
+        self.chunk_bytes = int(backend.sample_rate * chunk_duration) * 2
+        self.requests = queue.Queue()
+        self.server = None
+        self.lock = threading.Lock()
+
+        self.served = 0
+        self.batches = 0
+        self.queue_time = 0.0
+        self.synthesis_time = 0.0
+        self.audio_time = 0.0
+
+    @property
+    def info(self):
+        return {
+            "voice": self.backend.voice,
+            "sample_rate": self.backend.sample_rate,
+            "sample_width": 2,
+            "channels": 1,
+        }
+
+    def submit(self, text, lang):
+        request = SynthesisRequest(text, lang)
+        self.requests.put(request)
+        return request
+
+    def next_batch(self):
+        """Block for one request, then gather whatever else arrives within the batch window"""
+        batch = []
+        while not batch:
+            batch = [self.requests.get()]
+            deadline = time.perf_counter() + self.batch_window
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.requests.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            batch = [request for request in batch if not request.cancelled.is_set()]
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self.next_batch()
+            started = time.perf_counter()
+            try:
+                if len(batch) == 1:
+                    results = [self.stream_one(batch[0])]
+                else:
+                    results = self.backend.synthesize_batch([request.text for request in batch])
+            except Exception as e:
+                print(f"Error synthesizing batch of {len(batch)}: {e}")
+                for request in batch:
+                    request.chunks.put(e)
+                continue
+            elapsed = time.perf_counter() - started
+
+            with self.lock:
+                self.batches += 1
+                self.served += len(batch)
+                self.synthesis_time += elapsed
+                self.queue_time += sum(started - request.received for request in batch)
+                self.audio_time += sum(len(pcm) for pcm in results) / (2.0 * self.backend.sample_rate)
+
+            if len(batch) > 1:
+                for request, pcm in zip(batch, results):
+                    for start in range(0, len(pcm), self.chunk_bytes):
+                        request.chunks.put(pcm[start:start + self.chunk_bytes])
+            for request in batch:
+                request.chunks.put(None)
+
+    def stream_one(self, request):
+        """Hand a lone request its audio as the decoder produces it; returns all of its PCM"""
+        pcm = []
+        for chunk in self.backend.stream(request.text, request.lang):
+            if request.cancelled.is_set():
+                break  # the client hung up; leaving the generator stops the decoder
+            request.chunks.put(chunk)
+            pcm.append(chunk)
+        return b"".join(pcm)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "requests": self.served,
+                "batches": self.batches,
+                "mean_batch_size": round(self.served / float(self.batches), 2) if self.batches else 0.0,
+                "mean_queue_ms": round(1000 * self.queue_time / self.served, 1) if self.served else 0.0,
+                "realtime_factor": round(self.synthesis_time / self.audio_time, 3) if self.audio_time else 0.0,
+            }
+
+    def handle(self, rfile, wfile):
+        message = json.loads(rfile.readline().decode("utf-8"))
+        if message.get("command") == "info":
+            wfile.write((json.dumps(dict(self.info, stats=self.stats())) + "\n").encode("utf-8"))
+            return
+
+        request = self.submit(message["text"], message.get("lang", "en"))
+        try:
+            wfile.write((json.dumps(self.info) + "\n").encode("utf-8"))
+            while True:
+                chunk = request.chunks.get()
+                if isinstance(chunk, Exception):
+                    break  # the client sees a stream that ends without its terminator
+                if chunk is None:
+                    wfile.write(FRAME_HEADER.pack(0))
+                    break
+                wfile.write(FRAME_HEADER.pack(len(chunk)) + chunk)
+                wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client hung up, e.g. on a barge-in
+        finally:
+            request.cancelled.set()  # nothing more will be sent for it
+
+    def serve_forever(self):
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                try:
+                    server.handle(self.rfile, self.wfile)
+                except Exception as e:
+                    print(f"Error serving synthesis request: {e}")
+
+        if os.path.exists(self.address):
+            os.remove(self.address)  # stale socket from a previous run
+        threading.Thread(target=self._run, name="synthesis-batcher", daemon=True).start()
+        self.server = socketserver.ThreadingUnixStreamServer(self.address, Handler)
+        self.server.daemon_threads = True
+        print(f"Synthesis server for '{self.backend.voice}' listening on {self.address}")
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+            if os.path.exists(self.address):
+                os.remove(self.address)
+
+
+class ServerBackend(SpeechBackend):
+    """Speech from a running synthesis server, so sessions share one warm model"""
+
+    name = "server"
+
+    def __init__(self, address=DEFAULT_SOCKET, timeout=30):
+        self.address = address
+        self.timeout = timeout
+        connection, rfile = self.connect({"command": "info"})
+        with connection, rfile:
+            self.info = json.loads(rfile.readline().decode("utf-8"))
+
+    @property
+    def voice(self):
+        return self.info["voice"]  # same cache entries as the engine loaded in-process
+
+    @property
+    def sample_rate(self):
+        return self.info["sample_rate"]
+
+    def connect(self, message):
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.settimeout(self.timeout)
+        connection.connect(self.address)
+        connection.sendall((json.dumps(message) + "\n").encode("utf-8"))
+        return connection, connection.makefile("rb")
+
+    def stream(self, text, lang):
+        """Yield PCM chunks of ``text`` as the server sends them"""
+        connection, rfile = self.connect({"text": text, "lang": lang})
+        with connection, rfile:
+            header = json.loads(rfile.readline().decode("utf-8"))
+            if "error" in header:
+                raise RuntimeError(header["error"])
+            while True:
+                prefix = rfile.read(FRAME_HEADER.size)
+                if len(prefix) < FRAME_HEADER.size:
+                    raise RuntimeError("synthesis server closed the stream early")
+                size, = FRAME_HEADER.unpack(prefix)
+                if size == 0:
+                    return
+                yield rfile.read(size)
+
+    def synthesize(self, text, lang):
+        return AudioSegment(
+            data=b"".join(self.stream(text, lang)),
+            sample_width=self.info["sample_width"],
+            frame_rate=self.info["sample_rate"],
+            channels=self.info["channels"]
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the Tacotron2 voice to assistant sessions over a Unix socket")
+    parser.add_argument("--checkpoint", default=os.getenv("TACOTRON2_CHECKPOINT"), help="trained Tacotron2 checkpoint")
+    parser.add_argument("--waveglow", default=os.getenv("WAVEGLOW_CHECKPOINT", "waveglow_256channels_universal_v5.pt"),
+                        help="WaveGlow vocoder checkpoint")
+    parser.add_argument("--code-dir", default=os.getenv("TACOTRON2_CODE_DIR", "TTS-TT2"),
+                        help="checkout of the training repository")
+    parser.add_argument("--device", default=os.getenv("TTS_DEVICE"), help="cpu or cuda")
+    parser.add_argument("--threads", type=int, default=int(os.getenv("TTS_THREADS", "4")), help="CPU threads for inference")
+    parser.add_argument("--socket", default=os.getenv("TTS_SERVER_SOCKET", DEFAULT_SOCKET), help="Unix socket to listen on")
+    parser.add_argument("--max-batch", type=int, default=8, help="most requests synthesized together")
+    parser.add_argument("--window", type=float, default=0.02, help="seconds to wait for more requests to batch")
+    args = parser.parse_args()
+
+    backend = Tacotron2Backend(args.checkpoint, args.waveglow, code_dir=args.code_dir, device=args.device,
+                               threads=args.threads)
+    server = SynthesisServer(backend, args.socket, max_batch_size=args.max_batch, batch_window=args.window)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"Synthesis server stats: {server.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+import collections
+import numpy as np
+import speech_recognition as sr
+
+
+class VoiceActivityDetector:
+    """Frame-level voice activity detector scoring whole buffers with NumPy
+
+    Each frame is judged on RMS energy, zero-crossing rate and spectral flatness.
+    A frame is speech when it is loud enough and at least one of the spectral cues
+    looks voice-like, which rejects broadband noise such as fans, typing and
+    chatter bleeding in from other rooms. Hangover keeps short dips inside words
+    from splitting a phrase.
+    """
+
+    def __init__(self, sample_rate=16000, frame_duration=0.02, energy_threshold=300,
+                 zcr_threshold=0.35, flatness_threshold=0.4, hangover_duration=0.2,
+                 n_bands=8, band_snr_threshold=9.0):
+        self.sample_rate = sample_rate
+        self.frame_size = int(sample_rate * frame_duration)
+        self.frame_duration = frame_duration
+        self.energy_threshold = energy_threshold  # same RMS units as sr.Recognizer.energy_threshold
+        self.zcr_threshold = zcr_threshold
+        self.flatness_threshold = flatness_threshold
+        self.hangover_frames = int(round(hangover_duration / frame_duration))
+        self.window = np.hanning(self.frame_size).astype(np.float32)
+
+        # Log-spaced bands from 100 Hz to Nyquist over the rfft bins (DC dropped)
+        bin_hz = float(sample_rate) / self.frame_size
+        edges = np.geomspace(100, sample_rate / 2, n_bands + 1)[:-1]
+        self.band_edges = np.unique(np.clip((edges / bin_hz).astype(int) - 1, 0, self.frame_size // 2 - 1))
+        self.band_floor = None  # per-band noise power, set by NoiseFloorTracker
+        self.band_snr_threshold = band_snr_threshold
+        self.reset()
+
+    def reset(self):
+        """Forget carried-over samples and hangover state between utterances"""
+        self.remainder = np.zeros(0, dtype=np.int16)
+        self.frames_since_speech = self.hangover_frames + 1
+
+    def frames(self, pcm):
+        """Split int16 PCM into whole frames, carrying leftover samples to the next call"""
+        samples = np.concatenate([self.remainder, np.frombuffer(pcm, dtype=np.int16)])
+        count = len(samples) // self.frame_size
+        self.remainder = samples[count * self.frame_size:]
+        return samples[:count * self.frame_size].reshape(count, self.frame_size)
+
+    def features(self, frames):
+        """Return per-frame (rms energy, zero-crossing rate, spectral flatness, band power)"""
+        x = frames.astype(np.float32)
+        energy = np.sqrt(np.mean(x * x, axis=1))
+
+        signs = np.signbit(x)
+        zcr = np.mean(signs[:, 1:] != signs[:, :-1], axis=1)
+
+        power = np.abs(np.fft.rfft(x * self.window, axis=1))[:, 1:] ** 2 + 1e-10
+        flatness = np.exp(np.mean(np.log(power), axis=1)) / np.mean(power, axis=1)
+        band_power = np.add.reduceat(power, self.band_edges, axis=1)
+
+        return energy, zcr, flatness, band_power
+
+    def raw_decisions(self, frames):
+        energy, zcr, flatness, band_power = self.features(frames)
+        loud = energy > self.energy_threshold
+        band_floor = self.band_floor
+        if band_floor is not None:
+            # Speech standing out in any band counts even under a loud hum in another
+            band_snr = 10 * np.log10(band_power / band_floor)
+            loud |= band_snr.max(axis=1) > self.band_snr_threshold
+        voiced = (zcr < self.zcr_threshold) | (flatness < self.flatness_threshold)
+        return loud & voiced, energy, band_power
+
+    def speech_span(self, pcm, margin=0.1):
+        """(start, end) sample offsets of int16 ``pcm`` around its speech frames, or None without speech
+
+        Frames are judged on their own, without hangover, and ``margin``
+        seconds are kept on either side.
+        """
+        samples = np.frombuffer(pcm, dtype=np.int16)
+        count = len(samples) // self.frame_size
+        if not count:
+            return None
+        raw, _, _ = self.raw_decisions(samples[:count * self.frame_size].reshape(count, self.frame_size))
+        voiced = np.flatnonzero(raw)
+        if not len(voiced):
+            return None
+        pad = int(round(margin / self.frame_duration))
+        return max(voiced[0] - pad, 0) * self.frame_size, min((voiced[-1] + 1 + pad) * self.frame_size, len(samples))
+
+    def process(self, pcm):
+        """Score every complete frame in ``pcm``; returns (speech flags, frame energies, band powers)"""
+        frames = self.frames(pcm)
+        if len(frames) == 0:
+            return np.zeros(0, dtype=bool), np.zeros(0, dtype=np.float32), np.zeros((0, len(self.band_edges)))
+
+        raw, energy, band_power = self.raw_decisions(frames)
+
+        # Hangover: a frame counts as speech if raw speech occurred within the last
+        # hangover_frames frames, including frames from previous calls
+        index = np.arange(len(raw))
+        last_speech = np.where(raw, index, -self.frames_since_speech - 1)
+        last_speech = np.maximum.accumulate(last_speech)
+        since_speech = index - last_speech
+        speech = since_speech <= self.hangover_frames
+
+        self.frames_since_speech = int(since_speech[-1])
+        return speech, energy, band_power
+
+
+class NoiseFloorTracker:
+    """Continuous noise-floor estimate fed from the live stream
+
+    Energies of non-speech frames from the last few seconds are kept in a
+    window, overall and per band, and a low percentile of that window is the
+    floor. Every update pushes a fresh energy threshold and band floor to the
+    registered targets (detectors, ``sr.Recognizer``), so listening never pauses
+    for an ambient-noise calibration.
+    """
+
+    def __init__(self, detector, initial_threshold=300, window_duration=5.0, percentile=20,
+                 margin=3.0, min_threshold=100, min_noise_duration=0.25, max_speech_duration=15.0):
+        self.detector = detector  # private instance; its hangover state must not be shared
+        self.percentile = percentile
+        self.margin = margin
+        self.min_threshold = min_threshold
+        self.min_noise_frames = int(min_noise_duration / detector.frame_duration)
+        self.max_speech_duration = max_speech_duration
+        self.targets = [detector]
+
+        window = int(window_duration / detector.frame_duration)
+        self.energies = np.zeros(window, dtype=np.float32)
+        self.band_powers = np.zeros((window, len(detector.band_edges)), dtype=np.float32)
+        self.position = 0
+        self.filled = 0
+        self.speech_duration = 0
+
+        self.floor = initial_threshold / margin
+        self.band_floor = None
+        self.energy_threshold = initial_threshold
+        self.detector.energy_threshold = initial_threshold
+
+    def add_target(self, target):
+        """Keep ``target.energy_threshold`` (and ``band_floor`` if it has one) in sync"""
+        self.targets.append(target)
+        self.publish(target)
+
+    def process(self, pcm):
+        speech, energy, band_power = self.detector.process(pcm)
+        if len(speech) == 0:
+            return
+
+        # Frames quieter than the current floor are noise whatever the VAD says
+        noise = ~speech | (energy < self.floor)
+        if noise.any():
+            self.speech_duration = 0
+        else:
+            self.speech_duration += len(speech) * self.detector.frame_duration
+            if self.speech_duration > self.max_speech_duration:
+                # Nobody talks this long without a pause; the room got louder
+                noise[:] = True
+
+        self.push(energy[noise], band_power[noise])
+        if self.filled >= self.min_noise_frames:
+            self.update()
+
+    def push(self, energy, band_power):
+        window = len(self.energies)
+        energy, band_power = energy[-window:], band_power[-window:]
+        index = (self.position + np.arange(len(energy))) % window
+        self.energies[index] = energy
+        self.band_powers[index] = band_power
+        self.position = (self.position + len(energy)) % window
+        self.filled = min(self.filled + len(energy), window)
+
+    def update(self):
+        self.floor = float(np.percentile(self.energies[:self.filled], self.percentile))
+        self.band_floor = np.percentile(self.band_powers[:self.filled], self.percentile, axis=0) + 1e-10
+        self.energy_threshold = max(self.min_threshold, self.floor * self.margin)
+        for target in self.targets:
+            self.publish(target)
+
+    def publish(self, target):
+        target.energy_threshold = self.energy_threshold
+        if self.band_floor is not None and hasattr(target, "band_floor"):
+            target.band_floor = self.band_floor
+
+
+class VoiceActivitySegmenter:
+    """Cuts phrases out of an ``sr.AudioSource`` using a VoiceActivityDetector
+
+    Drop-in replacement for ``sr.Recognizer.listen``: same timeout and
+    phrase_time_limit semantics, raises ``sr.WaitTimeoutError`` and returns
+    ``sr.AudioData``.
+    """
+
+    def __init__(self, detector, pause_threshold=0.8, phrase_threshold=0.3, non_speaking_duration=0.5,
+                 noise_tracker=None):
+        self.detector = detector
+        self.noise_tracker = noise_tracker  # fed here only when nothing else feeds it the stream
+        self.pause_threshold = pause_threshold
+        self.phrase_threshold = phrase_threshold
+        self.non_speaking_duration = non_speaking_duration
+
+    def listen(self, source, timeout=None, phrase_time_limit=None):
+        assert source.stream is not None, "Audio source must be entered before listening"
+        self.detector.reset()
+
+        frame_bytes = self.detector.frame_size * source.SAMPLE_WIDTH
+        frame_duration = self.detector.frame_duration
+        pre_roll_frames = int(self.non_speaking_duration / frame_duration)
+        min_speech_frames = int(self.phrase_threshold / frame_duration)
+        pause_frames = int(self.pause_threshold / frame_duration)
+
+        pending = b""
+        elapsed_time = 0
+        pre_roll = collections.deque(maxlen=pre_roll_frames + min_speech_frames + 1)
+        phrase = []
+        phrase_start_time = None
+        speech_count = 0
+        pause_count = 0
+
+        while True:
+            buffer = source.stream.read(source.CHUNK)
+            if len(buffer) == 0:
+                break
+            elapsed_time += float(len(buffer)) / (source.SAMPLE_RATE * source.SAMPLE_WIDTH)
+
+            pending += buffer
+            whole = len(pending) - len(pending) % frame_bytes
+            chunk, pending = pending[:whole], pending[whole:]
+            if self.noise_tracker is not None:
+                self.noise_tracker.process(chunk)
+            speech = self.detector.process(chunk)[0]
+
+            for i, is_speech in enumerate(speech):
+                frame = chunk[i * frame_bytes:(i + 1) * frame_bytes]
+
+                if phrase_start_time is None:
+                    pre_roll.append(frame)
+                    if not is_speech:
+                        speech_count = 0
+                        continue
+                    speech_count += 1
+                    if speech_count < min_speech_frames:
+                        continue
+                    # Phrase confirmed: keep the leading context and the onset frames
+                    phrase = list(pre_roll)
+                    phrase_start_time = elapsed_time
+                    pause_count = 0
+                    continue
+
+                phrase.append(frame)
+                pause_count = 0 if is_speech else pause_count + 1
+                if pause_count > pause_frames:
+                    # Keep no more trailing silence than leading context
+                    return self._audio_data(phrase[:len(phrase) - pause_count + pre_roll_frames], source)
+
+            if phrase_start_time is None:
+                if timeout and elapsed_time > timeout:
+                    raise sr.WaitTimeoutError("listening timed out while waiting for phrase to start")
+            elif phrase_time_limit and elapsed_time - phrase_start_time > phrase_time_limit:
+                return self._audio_data(phrase, source)
+
+        if phrase:
+            return self._audio_data(phrase, source)
+        raise sr.WaitTimeoutError("audio stream ended before a phrase started")
+
+    def _audio_data(self, frames, source):
+        return sr.AudioData(b"".join(frames), source.SAMPLE_RATE, source.SAMPLE_WIDTH)
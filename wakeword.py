@@ -0,0 +1,318 @@
+import argparse
+import os
+import threading
+import wave
+import numpy as np
+
+FRAME_DURATION = 0.025
+HOP_DURATION = 0.01
+N_MELS = 40
+
+
+def mel_filterbank(sample_rate, n_fft, n_mels=N_MELS, low_hz=60):
+    """Triangular mel filters as an (n_mels, n_fft // 2 + 1) matrix"""
+    def hz_to_mel(hz):
+        return 2595 * np.log10(1 + hz / 700.0)
+
+    def mel_to_hz(mel):
+        return 700 * (10 ** (mel / 2595.0) - 1)
+
+    mels = np.linspace(hz_to_mel(low_hz), hz_to_mel(sample_rate / 2), n_mels + 2)
+    bins = np.floor((n_fft + 1) * mel_to_hz(mels) / sample_rate).astype(int)
+
+    filters = np.zeros((n_mels, n_fft // 2 + 1), dtype=np.float32)
+    for m in range(1, n_mels + 1):
+        left, center, right = bins[m - 1], bins[m], bins[m + 1]
+        if center > left:
+            filters[m - 1, left:center] = (np.arange(left, center) - left) / float(center - left)
+        if right > center:
+            filters[m - 1, center:right] = (right - np.arange(center, right)) / float(right - center)
+    return filters
+
+
+class FeatureExtractor:
+    """Log-mel features normalized per frame for gain-independent template matching"""
+
+    def __init__(self, sample_rate=16000):
+        self.sample_rate = sample_rate
+        self.frame_size = int(sample_rate * FRAME_DURATION)
+        self.hop_size = int(sample_rate * HOP_DURATION)
+        self.n_fft = 1 << (self.frame_size - 1).bit_length()
+        self.window = np.hamming(self.frame_size).astype(np.float32)
+        self.filters = mel_filterbank(sample_rate, self.n_fft)
+
+    def __call__(self, samples):
+        """Return (features, log_energy) for int16 or float samples"""
+        samples = np.asarray(samples, dtype=np.float32)
+        if len(samples) < self.frame_size:
+            return np.zeros((0, N_MELS), dtype=np.float32), np.zeros(0, dtype=np.float32)
+
+        count = 1 + (len(samples) - self.frame_size) // self.hop_size
+        index = np.arange(self.frame_size)[None, :] + self.hop_size * np.arange(count)[:, None]
+        frames = samples[index] * self.window
+
+        power = np.abs(np.fft.rfft(frames, n=self.n_fft, axis=1)) ** 2
+        log_mel = np.log(power @ self.filters.T + 1e-6)
+        log_energy = np.log(np.sum(power, axis=1) + 1e-6)
+
+        features = log_mel - log_mel.mean(axis=1, keepdims=True)
+        features /= np.linalg.norm(features, axis=1, keepdims=True) + 1e-6
+        return features.astype(np.float32), log_energy
+
+    def trim(self, features, log_energy, floor_db=30):
+        """Drop leading and trailing frames more than ``floor_db`` below the loudest frame"""
+        if len(features) == 0:
+            return features
+        voiced = np.flatnonzero(log_energy > log_energy.max() - floor_db / 10.0 * np.log(10))
+        return features[voiced[0]:voiced[-1] + 1]
+
+
+def subsequence_dtw(template, window):
+    """Lowest length-normalized cost of ``template`` aligned anywhere inside ``window``
+
+    Uses slope-constrained steps (1,1), (1,2), (2,1) so each template row only
+    depends on the two previous rows and is computed as one vectorized update.
+    Returns (cost, end_frame).
+    """
+    cost = 1 - template @ window.T
+    rows, columns = cost.shape
+    if columns < 2:
+        return np.inf, 0
+
+    previous2 = np.full(columns, np.inf)
+    previous = cost[0].copy()  # free start anywhere in the window
+    for i in range(1, rows):
+        best = np.full(columns, np.inf)
+        best[1:] = np.minimum(previous[:-1], previous2[:-1])
+        best[2:] = np.minimum(best[2:], previous[:-2])
+        previous2, previous = previous, cost[i] + best
+
+    end = int(np.argmin(previous))
+    return previous[end] / rows, end
+
+
+class WakeWordSpotter:
+    """Offline keyword spotter matching the live stream against enrolled templates
+
+    Templates are log-mel sequences of a few recordings per wake phrase, stored
+    in one ``.npz`` file shared by both language modules. Detection runs
+    subsequence DTW on a sliding window every ``hop_duration`` seconds on its own
+    thread, reading the MicrophoneStream ring buffer, so no audio leaves the
+    device until the wake phrase has been heard.
+    """
+
+    def __init__(self, phrases, template_path, sample_rate=16000, threshold=0.35,
+                 min_templates=3, hop_duration=0.1, threshold_margin=1.3):
+        self.phrases = list(phrases)
+        self.template_path = template_path
+        self.extractor = FeatureExtractor(sample_rate)
+        self.default_threshold = threshold
+        self.min_templates = min_templates
+        self.hop_duration = hop_duration
+        self.threshold_margin = threshold_margin
+        self.energy_threshold = 0  # RMS gate, kept in sync by NoiseFloorTracker
+        self.templates = {phrase: [] for phrase in self.phrases}
+        self.thresholds = {}
+        self.lock = threading.Lock()
+
+        self.stream = None
+        self.thread = None
+        self.armed = threading.Event()
+        self.detected = threading.Event()
+        self.detection = None
+        self.load()
+
+    @property
+    def ready(self):
+        """True once some phrase has enough templates to be spotted locally"""
+        return any(len(templates) >= self.min_templates for templates in self.templates.values())
+
+    def load(self):
+        if not os.path.exists(self.template_path):
+            return
+        try:
+            with np.load(self.template_path) as data:
+                for key in data.files:
+                    phrase, _, name = key.rpartition("::")
+                    if phrase not in self.templates:
+                        continue
+                    if name == "threshold":
+                        if np.isfinite(data[key]):
+                            self.thresholds[phrase] = float(data[key])
+                    else:
+                        self.templates[phrase].append(data[key])
+        except Exception as e:
+            print(f"Error loading wake word templates: {e}")
+
+    def save(self):
+        arrays = {}
+        if os.path.exists(self.template_path):
+            # Keep templates of phrases owned by the other language module
+            with np.load(self.template_path) as data:
+                arrays = {key: data[key] for key in data.files if key.rpartition("::")[0] not in self.templates}
+        for phrase, templates in self.templates.items():
+            for i, template in enumerate(templates):
+                arrays[f"{phrase}::{i}"] = template
+            if phrase in self.thresholds:
+                arrays[f"{phrase}::threshold"] = np.array(self.thresholds[phrase])
+        np.savez(self.template_path, **arrays)
+
+    def enroll(self, phrase, recordings, max_length_ratio=2.0):
+        """Add recordings (int16 sample arrays or ``sr.AudioData``) as templates for ``phrase``
+
+        A take more than ``max_length_ratio`` times longer or shorter than an
+        enrolled one is rejected: the DTW slope limit leaves no path between
+        them, so they could never match each other.
+        """
+        added = 0
+        for recording in recordings:
+            if hasattr(recording, "get_raw_data"):
+                recording = np.frombuffer(
+                    recording.get_raw_data(convert_rate=self.extractor.sample_rate, convert_width=2),
+                    dtype=np.int16
+                )
+            features = self.extractor.trim(*self.extractor(recording))
+            if len(features) < 10:
+                continue
+            with self.lock:
+                templates = self.templates.setdefault(phrase, [])
+                lengths = [len(template) for template in templates]
+                if lengths and max(max(lengths) / len(features), len(features) / min(lengths)) > max_length_ratio:
+                    print(f"Wake word take of {len(features)} frames rejected, enrolled takes have {lengths}")
+                    continue
+                templates.append(features)
+            added += 1
+
+        with self.lock:
+            templates = self.templates.get(phrase, [])
+            if len(templates) >= 2:
+                # Accept anything about as close as the enrolled takes are to each other
+                costs = [subsequence_dtw(a, b)[0] for a in templates for b in templates if a is not b]
+                costs = [cost for cost in costs if np.isfinite(cost)]
+                if costs:
+                    self.thresholds[phrase] = float(np.mean(costs)) * self.threshold_margin
+                else:
+                    self.thresholds.pop(phrase, None)  # no pair aligns; score with default_threshold
+        self.save()
+        return added
+
+    def score(self, features):
+        """Best (phrase, cost, end_frame) over all templates, or None when nothing matches"""
+        best = None
+        with self.lock:
+            for phrase, templates in self.templates.items():
+                threshold = self.thresholds.get(phrase, self.default_threshold)
+                for template in templates:
+                    cost, end = subsequence_dtw(template, features)
+                    if cost < threshold and (best is None or cost < best[1]):
+                        best = (phrase, cost, end)
+        return best
+
+    def start(self, microphone_stream):
+        self.stream = microphone_stream
+        self.thread = threading.Thread(target=self._run, name="wakeword-spotter", daemon=True)
+        self.thread.start()
+
+    def wait(self, timeout=None):
+        """Listen for a wake phrase; returns (phrase, cost) or None on timeout"""
+        if not self.armed.is_set() and not self.detected.is_set():
+            self.armed.set()
+        if not self.detected.wait(timeout):
+            return None
+
+        self.armed.clear()
+        self.detected.clear()
+        phrase, cost, end_index = self.detection
+        # Listeners start after the wake phrase, so it never reaches the cloud
+        self.stream.read_index = max(self.stream.read_index, end_index)
+        return phrase, cost
+
+    def _run(self):
+        buffer = self.stream.buffer
+        seconds_per_chunk = self.stream.seconds_per_chunk
+        hop_chunks = max(1, int(round(self.hop_duration / seconds_per_chunk)))
+
+        while self.stream.running:
+            if not self.armed.wait(timeout=1):
+                continue
+
+            with self.lock:
+                longest = max([len(t) for templates in self.templates.values() for t in templates] or [100])
+            window_chunks = int(1.5 * longest * HOP_DURATION / seconds_per_chunk) + 1
+
+            index = buffer.end_index
+            chunks = []
+            while self.armed.is_set() and not self.detected.is_set():
+                chunk, index = buffer.read(index, timeout=1)
+                if not chunk:
+                    if buffer.closed:
+                        return
+                    continue
+                chunks.append(chunk)
+                chunks = chunks[-window_chunks:]
+                if index % hop_chunks:
+                    continue
+
+                samples = np.frombuffer(b"".join(chunks), dtype=np.int16)
+                if np.sqrt(np.mean(samples.astype(np.float32) ** 2)) < self.energy_threshold:
+                    continue
+
+                features, _ = self.extractor(samples)
+                match = self.score(features)
+                if match is None:
+                    continue
+
+                phrase, cost, end_frame = match
+                unread = len(samples) - (end_frame * self.extractor.hop_size + self.extractor.frame_size)
+                end_index = index - int(unread // (len(samples) / len(chunks)))
+                self.detection = (phrase, cost, end_index)
+                self.detected.set()
+                self.armed.clear()  # idle until wait() has taken the detection and re-arms
+
+
+def read_wav(path, sample_rate=16000):
+    """Mono int16 samples from a WAV file, resampled linearly if needed"""
+    with wave.open(path, "rb") as wav:
+        channels, width, rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+        data = wav.readframes(wav.getnframes())
+    if width != 2:
+        raise ValueError(f"{path}: only 16-bit WAV files are supported")
+    samples = np.frombuffer(data, dtype=np.int16).reshape(-1, channels).mean(axis=1)
+    if rate != sample_rate:
+        positions = np.arange(0, len(samples), rate / float(sample_rate))
+        samples = np.interp(positions, np.arange(len(samples)), samples)
+    return samples.astype(np.int16)
+
+
+def record(count, sample_rate=16000):
+    """Record ``count`` takes from the default microphone"""
+    import speech_recognition as sr
+
+    recognizer = sr.Recognizer()
+    takes = []
+    with sr.Microphone(sample_rate=sample_rate) as source:
+        recognizer.adjust_for_ambient_noise(source, duration=1)
+        for i in range(count):
+            input(f"Press Enter and say the wake phrase ({i + 1}/{count})...")
+            takes.append(recognizer.listen(source, timeout=5, phrase_time_limit=3))
+    return takes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Enroll custom wake phrases for the offline spotter")
+    parser.add_argument("phrase", help="wake phrase, e.g. 'hey eva'")
+    parser.add_argument("recordings", nargs="*", help="16-bit WAV takes; records from the microphone if omitted")
+    parser.add_argument("--count", type=int, default=3, help="takes to record when no WAV files are given")
+    parser.add_argument("--templates", default="wakeword_templates.npz", help="template file to update")
+    args = parser.parse_args()
+
+    phrase = args.phrase.lower().strip()
+    takes = [read_wav(path) for path in args.recordings] or record(args.count)
+    spotter = WakeWordSpotter([phrase], args.templates)
+    added = spotter.enroll(phrase, takes)
+    print(f"Enrolled {added} take(s) for '{phrase}' "
+          f"({len(spotter.templates[phrase])} total, threshold {spotter.thresholds.get(phrase, spotter.default_threshold):.3f})")
+
+
+if __name__ == "__main__":
+    main()